@@ -0,0 +1,87 @@
+"""Compare parsing a status into SDInfo eagerly, lazily and without icons.
+
+Usage: python benchmarks/parsing.py
+"""
+
+import timeit
+import tracemalloc
+
+from streamdeckapi.tools import json_dumps, json_loads
+from streamdeckapi.types import SDApplication, SDButton, SDDevice, SDInfo
+
+from serialization import APPLICATION, create_status
+
+
+def create_message(decks: int) -> str:
+    """Create a status message of Stream Deck XLs as sent by the server."""
+    devices, buttons = create_status(decks)
+    # Every button gets its own icon, like on a configured deck
+    for key, button in buttons.items():
+        button.svg = button.svg.replace("Configure", f"Button {key}")
+    return json_dumps(
+        {
+            "event": "status",
+            "args": {
+                "version": 1,
+                "devices": [device.to_dict() for device in devices],
+                "application": APPLICATION.to_dict(),
+                "buttons": {
+                    str(key): button.to_dict() for key, button in buttons.items()
+                },
+            },
+        }
+    )
+
+
+def eager_path(message: str):
+    """Parsing as done before, building all buttons right away."""
+    obj = json_loads(message)["args"]
+    info = dict(obj)
+    devices = [SDDevice(device) for device in obj["devices"]]
+    buttons = {_id: SDButton(button) for _id, button in obj["buttons"].items()}
+    return info, SDApplication(obj["application"]), devices, buttons
+
+
+def lazy_path(message: str):
+    """Parsing with SDInfo, the buttons are never accessed."""
+    return SDInfo(json_loads(message)["args"])
+
+
+def lazy_buttons_path(message: str):
+    """Parsing with SDInfo, accessing all buttons."""
+    info = SDInfo(json_loads(message)["args"])
+    return info, info.buttons
+
+
+def without_svg_path(message: str):
+    """Parsing with SDInfo without icons, accessing all buttons."""
+    info = SDInfo(json_loads(message)["args"], with_svg=False)
+    return info, info.buttons
+
+
+def measure(name: str, func, message: str, number: int = 200):
+    """Print the mean time and the retained memory of a parser."""
+    seconds = min(timeit.repeat(lambda: func(message), number=number, repeat=5))
+
+    tracemalloc.start()
+    result = func(message)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    print(f"  {name:<24} {seconds / number * 1e6:10.1f} us {retained / 1024:10.1f} KiB")
+
+
+def main():
+    """Run the benchmark."""
+    for name, decks in (("32 keys (1 x XL)", 1), ("128 keys (4 x XL)", 4)):
+        message = create_message(decks)
+        print(f"{name}, {len(message) / 1024:.1f} KiB message")
+        measure("eager", eager_path, message)
+        measure("lazy", lazy_path, message)
+        measure("lazy, buttons accessed", lazy_buttons_path, message)
+        measure("without svg", without_svg_path, message)
+
+
+if __name__ == "__main__":
+    main()
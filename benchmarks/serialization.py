@@ -0,0 +1,122 @@
+"""Compare status serialization with jsonpickle and the explicit serializers.
+
+Usage: python benchmarks/serialization.py
+"""
+
+import json
+import timeit
+
+from streamdeckapi.tools import json_dumps, set_json_backend
+from streamdeckapi.types import SDApplication, SDButton, SDDevice
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from jsonpickle import encode
+except ImportError:
+    encode = None
+
+SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" height="144" width="144">'
+    '<rect width="144" height="144" fill="black" />'
+    '<circle cx="32" cy="72" r="10" fill="white" />'
+    '<circle cx="72" cy="72" r="10" fill="white" />'
+    '<circle cx="112" cy="72" r="10" fill="white" />'
+    '<text x="10" y="120" font-size="28px" fill="white">Configure</text>'
+    "</svg>"
+)
+
+APPLICATION = SDApplication(
+    {
+        "font": "Segoe UI",
+        "language": "en",
+        "platform": "Linux",
+        "platformVersion": "6.1.0",
+        "version": "0.0.1",
+    }
+)
+
+
+def create_status(decks: int) -> tuple:
+    """Create devices and buttons of Stream Deck XLs."""
+    devices = []
+    buttons = {}
+    for deck in range(decks):
+        serial = f"CL{deck:010d}"
+        devices.append(
+            SDDevice(
+                {
+                    "id": serial,
+                    "name": "Stream Deck XL",
+                    "size": {"columns": 8, "rows": 4},
+                    "type": 20,
+                }
+            )
+        )
+        for key in range(32):
+            buttons[deck * 32 + key] = SDButton(
+                {
+                    "uuid": f"button-{deck}-{key}",
+                    "device": serial,
+                    "position": {"x": key % 8, "y": key // 8},
+                    "svg": SVG,
+                }
+            )
+    return devices, buttons
+
+
+def jsonpickle_path(devices, buttons) -> str:
+    """Serialization as done before the explicit serializers."""
+    data_str = encode(
+        {"devices": devices, "application": APPLICATION, "buttons": buttons},
+        unpicklable=False,
+    )
+    return (
+        data_str.replace('"x_pos"', '"x"')
+        .replace('"y_pos"', '"y"')
+        .replace('"platform_version"', '"platformVersion"')
+    )
+
+
+def to_dict_path(devices, buttons) -> str:
+    """Serialization with to_dict and the selected JSON backend."""
+    return json_dumps(
+        {
+            "devices": [device.to_dict() for device in devices],
+            "application": APPLICATION.to_dict(),
+            "buttons": {str(key): button.to_dict() for key, button in buttons.items()},
+        }
+    )
+
+
+def measure(name: str, func, devices, buttons, number: int = 200):
+    """Print the mean time of a serializer."""
+    seconds = min(
+        timeit.repeat(lambda: func(devices, buttons), number=number, repeat=5)
+    )
+    print(f"  {name:<24} {seconds / number * 1e6:10.1f} us")
+
+
+def main():
+    """Run the benchmark."""
+    for name, decks in (("32 keys (1 x XL)", 1), ("128 keys (4 x XL)", 4)):
+        devices, buttons = create_status(decks)
+        print(name)
+        if encode is not None:
+            measure("jsonpickle", jsonpickle_path, devices, buttons)
+        else:
+            print("  jsonpickle               not installed")
+        set_json_backend(json.dumps, json.loads)
+        measure("to_dict + json", to_dict_path, devices, buttons)
+        if orjson is not None:
+            set_json_backend(
+                lambda obj: orjson.dumps(obj).decode("utf-8"), orjson.loads
+            )
+            measure("to_dict + orjson", to_dict_path, devices, buttons)
+
+
+if __name__ == "__main__":
+    main()
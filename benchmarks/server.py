@@ -0,0 +1,292 @@
+"""Drive the server with fake decks, no hardware needed.
+
+Measures icon update throughput, the latency from a key press to its websocket
+event, /sd/info requests per second and key event delivery to many clients.
+
+Usage: python benchmarks/server.py [--decks xl,xl] [--write-latency MS]
+    [--clients 1,10,100] [--min-icons-per-second N] [--min-info-rate N]
+    [--max-p99-ms MS]
+
+Exits with 1 if a result is worse than a given limit, so it can guard against
+regressions in CI.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import functools
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import aiohttp
+
+from streamdeckapi.const import (
+    PLUGIN_ICON,
+    PLUGIN_ICONS,
+    PLUGIN_INFO,
+    RENDER_EXECUTOR,
+    RENDER_WORKERS,
+)
+from streamdeckapi.fake import FakeStreamDeck, create_fake_decks
+from streamdeckapi.render import create_executor
+from streamdeckapi.server import StreamDeckServer, parse_models
+
+HOST = "127.0.0.1"
+
+# The server logs with print, results go to the real stdout
+report = functools.partial(print, file=sys.__stdout__, flush=True)
+
+
+def create_svg(label: str) -> str:
+    """Create an icon with a label, so every icon renders differently."""
+    return (
+        '<svg xmlns="http://www.w3.org/2000/svg" height="144" width="144">'
+        '<rect width="144" height="144" fill="black" />'
+        f'<text x="10" y="80" font-size="28px" fill="white">{label}</text>'
+        "</svg>"
+    )
+
+
+def format_latencies(seconds: List[float]) -> str:
+    """Format the percentiles of latencies in milliseconds."""
+    quantiles = statistics.quantiles(seconds, n=100, method="inclusive")
+    return (
+        f"p50 {quantiles[49] * 1000:7.2f} ms  p90 {quantiles[89] * 1000:7.2f} ms  "
+        f"p99 {quantiles[98] * 1000:7.2f} ms  max {max(seconds) * 1000:7.2f} ms"
+    )
+
+
+async def wait_for(condition: Callable[[], bool], timeout: float = 60):
+    """Wait until a condition is true."""
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("Condition not met in time")
+        await asyncio.sleep(0.001)
+
+
+async def icon_throughput(
+    server: StreamDeckServer, http: aiohttp.ClientSession, url: str, rounds: int
+) -> Dict[str, float]:
+    """Set every icon of all decks once per round and wait until it is written.
+
+    Returns:
+        Dict[str, float]: Icons per second by mode
+    """
+    decks: List[FakeStreamDeck] = server.streamdecks
+    rates = {}
+    uuids = [button.uuid for button in server.registry.all().values()]
+    for mode in ("single", "batch"):
+        started = time.perf_counter()
+        for index in range(rounds):
+            writes = sum(deck.writes for deck in decks)
+            icons = {uuid: create_svg(f"{mode} {index} {uuid}") for uuid in uuids}
+            if mode == "single":
+                for uuid, svg in icons.items():
+                    await http.post(f"{url}{PLUGIN_ICON}/{uuid}", data=svg)
+            else:
+                await http.post(f"{url}{PLUGIN_ICONS}", json=icons)
+            await wait_for(
+                lambda writes=writes: sum(deck.writes for deck in decks) - writes
+                >= len(uuids)
+            )
+        seconds = time.perf_counter() - started
+        rates[mode] = len(uuids) * rounds / seconds
+        report(
+            f"  {mode:<8} {rates[mode]:8.1f} icons/s  "
+            f"{seconds / rounds * 1000:8.1f} ms per page of {len(uuids)} icons"
+        )
+    return rates
+
+
+async def connect_clients(
+    http: aiohttp.ClientSession, url: str, count: int
+) -> List[aiohttp.ClientWebSocketResponse]:
+    """Connect websocket clients subscribed to keyDown events only."""
+    clients = []
+    for _ in range(count):
+        web_socket = await http.ws_connect(f"{url}/?events=keyDown")
+        # The connected message and the status
+        await web_socket.receive()
+        await web_socket.receive()
+        clients.append(web_socket)
+    return clients
+
+
+async def receive_at(web_socket: aiohttp.ClientWebSocketResponse) -> float:
+    """Receive a message, get when it arrived."""
+    await web_socket.receive()
+    return time.perf_counter()
+
+
+async def key_latency(
+    deck: FakeStreamDeck, clients: List[aiohttp.ClientWebSocketResponse], presses: int
+) -> List[float]:
+    """Press keys and measure when each client receives the keyDown event."""
+    latencies = []
+    for index in range(presses):
+        key = index % deck.key_count()
+        pressed = time.perf_counter()
+        deck.press(key)
+        arrivals = await asyncio.gather(*(receive_at(client) for client in clients))
+        latencies.extend(arrival - pressed for arrival in arrivals)
+        deck.release(key)
+        # Let the release pass, so the next press is a separate read
+        await asyncio.sleep(0.005)
+    return latencies
+
+
+async def info_rate(http: aiohttp.ClientSession, url: str, duration: float, etag):
+    """Request /sd/info from concurrent workers for a while."""
+    headers = {} if etag is None else {"If-None-Match": etag}
+    deadline = time.perf_counter() + duration
+    count = 0
+
+    async def worker():
+        nonlocal count
+        while time.perf_counter() < deadline:
+            async with http.get(f"{url}{PLUGIN_INFO}", headers=headers) as response:
+                await response.read()
+            count += 1
+
+    await asyncio.gather(*(worker() for _ in range(8)))
+    return count / duration
+
+
+def check_limits(
+    args: argparse.Namespace,
+    icon_rates: Dict[str, float],
+    info_rates: Dict[str, float],
+    p99s: Dict[int, float],
+) -> List[str]:
+    """Compare the results with the given limits.
+
+    Returns:
+        List[str]: Descriptions of the exceeded limits
+    """
+    failures = []
+    if args.min_icons_per_second is not None:
+        failures.extend(
+            f"{mode} icon updates: {rate:.1f} icons/s < {args.min_icons_per_second}"
+            for mode, rate in icon_rates.items()
+            if rate < args.min_icons_per_second
+        )
+    if args.min_info_rate is not None:
+        failures.extend(
+            f"/sd/info {name}: {rate:.0f} requests/s < {args.min_info_rate}"
+            for name, rate in info_rates.items()
+            if rate < args.min_info_rate
+        )
+    if args.max_p99_ms is not None:
+        failures.extend(
+            f"key events to {count} clients: p99 {p99:.2f} ms > {args.max_p99_ms}"
+            for count, p99 in p99s.items()
+            if p99 > args.max_p99_ms
+        )
+    return failures
+
+
+async def run(args: argparse.Namespace) -> List[str]:
+    """Run the benchmark.
+
+    Returns:
+        List[str]: Descriptions of the exceeded limits
+    """
+    decks = create_fake_decks(args.decks, args.write_latency / 1000)
+    server = StreamDeckServer(
+        decks,
+        db_file=os.path.join(tempfile.mkdtemp(), "streamdeckapi.db"),
+        render_executor=create_executor(args.render_executor, args.render_workers),
+    )
+    url = f"http://{HOST}:{args.port}"
+
+    started = time.perf_counter()
+    await server.init_all()
+    await server.start_server_async(HOST, args.port)
+    report(
+        f"{len(decks)} deck(s), {len(server.registry.all())} keys, "
+        f"{args.write_latency} ms per write, started in "
+        f"{(time.perf_counter() - started) * 1000:.0f} ms"
+    )
+
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as http:
+        # Keeps the decks from showing the no connection screen
+        observer = await http.ws_connect(url)
+
+        report("Icon updates")
+        icon_rates = await icon_throughput(server, http, url, args.rounds)
+
+        report("/sd/info")
+        info_rates = {}
+        etag = server.snapshot.etag
+        for name, match in (("full", None), ("not modified", etag)):
+            info_rates[name] = await info_rate(http, url, args.duration, match)
+            report(f"  {name:<12} {info_rates[name]:8.0f} requests/s")
+
+        report("Key press to websocket event")
+        p99s = {}
+        for count in args.clients:
+            clients = await connect_clients(http, url, count)
+            latencies = await key_latency(decks[0], clients, args.presses)
+            report(f"  {count:>3} clients  {format_latencies(latencies)}")
+            quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+            p99s[count] = quantiles[98] * 1000
+            for client in clients:
+                await client.close()
+
+        await observer.close()
+    server.close()
+    return check_limits(args, icon_rates, info_rates, p99s)
+
+
+def main():
+    """Parse the arguments and run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", maxsplit=1)[0])
+    parser.add_argument("--decks", type=parse_models, default=["xl"])
+    parser.add_argument("--write-latency", type=float, default=2, metavar="MS")
+    parser.add_argument(
+        "--clients",
+        type=lambda value: [int(count) for count in value.split(",")],
+        default=[1, 10, 50, 100],
+    )
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--presses", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=2, metavar="SECONDS")
+    parser.add_argument(
+        "--render-executor", choices=["process", "thread"], default=RENDER_EXECUTOR
+    )
+    parser.add_argument("--render-workers", type=int, default=RENDER_WORKERS)
+    parser.add_argument("--port", type=int, default=6253)
+    parser.add_argument("--verbose", action="store_true", help="show server output")
+    parser.add_argument(
+        "--min-icons-per-second",
+        type=float,
+        help="fail if single or batch icon updates are slower",
+    )
+    parser.add_argument(
+        "--min-info-rate", type=float, help="fail if /sd/info serves fewer requests/s"
+    )
+    parser.add_argument(
+        "--max-p99-ms",
+        type=float,
+        help="fail if the p99 latency of key events to any client count is higher",
+    )
+    args = parser.parse_args()
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            devnull = stack.enter_context(open(os.devnull, "w", encoding="utf-8"))
+            stack.enter_context(contextlib.redirect_stdout(devnull))
+        failures = asyncio.run(run(args))
+    for failure in failures:
+        report(f"Limit exceeded: {failure}")
+    if len(failures) > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Measure the startup cost of the client and the server in fresh interpreters.
+
+Usage: python benchmarks/startup.py
+"""
+
+import statistics
+import subprocess
+import sys
+
+# Modules that need native libraries or are slow to import
+HEAVY_MODULES = ("cairosvg", "PIL.Image", "zeroconf", "StreamDeck.DeviceManager")
+
+CASES = (
+    ("import streamdeckapi", "import streamdeckapi"),
+    ("import streamdeckapi.server", "import streamdeckapi.server"),
+    (
+        "parse server args",
+        "from streamdeckapi.server import parse_args\nparse_args([])",
+    ),
+    (
+        "create server",
+        "import tempfile, os\n"
+        "from streamdeckapi.server import StreamDeckServer\n"
+        "StreamDeckServer([], db_file=os.path.join(tempfile.mkdtemp(), 'sd.db'))",
+    ),
+)
+
+SCRIPT = """
+import sys, time
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(elapsed, ",".join(heavy))
+"""
+
+
+def run(code: str):
+    """Run code in a fresh interpreter, get its duration and the heavy imports."""
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT.format(code=code, heavy=HEAVY_MODULES)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.split()
+    return float(output[0]), output[1] if len(output) > 1 else "-"
+
+
+def main(repeat: int = 10):
+    """Run the benchmark."""
+    # Compile the bytecode first, so the first run isn't slower
+    run("import streamdeckapi.server")
+    print(f"{'':<30} {'median':>10} {'min':>10}  heavy imports")
+    for name, code in CASES:
+        results = [run(code) for _ in range(repeat)]
+        seconds = [elapsed for elapsed, _ in results]
+        print(
+            f"{name:<30} {statistics.median(seconds) * 1000:7.1f} ms "
+            f"{min(seconds) * 1000:7.1f} ms  {results[0][1]}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -24,16 +24,15 @@ setup(
     url="https://github.com/Patrick762/streamdeckapi",
     packages=find_packages(),
     install_requires=[
-        "requests",
         "websockets>=13.1",
         "aiohttp>=3.8",
         "human-readable-ids==0.1.3",
-        "jsonpickle==3.0.1",
         "streamdeck==0.9.3",
         "pillow",
         "cairosvg==2.7.0",
         "zeroconf",
     ],
+    extras_require={"fast": ["orjson"]},
     keywords=[],
     entry_points={
         "console_scripts": ["streamdeckapi-server = streamdeckapi.server:start"]
@@ -1,20 +1,38 @@
 """Stream Deck API."""
 
 import asyncio
-from typing import Callable
-import json
+import itertools
+import random
+from typing import Callable, Dict, Set
+from urllib.parse import urlencode
 import logging
 
-import requests
+import aiohttp
 from websockets.client import connect
 from websockets.exceptions import WebSocketException
 
-from streamdeckapi.const import PLUGIN_ICON, PLUGIN_INFO, PLUGIN_PORT
-
+from streamdeckapi.const import (
+    HTTP_MAX_CONNECTIONS,
+    HTTP_TIMEOUT_SECONDS,
+    PLUGIN_ICON,
+    PLUGIN_ICONS,
+    PLUGIN_INFO,
+    PLUGIN_PORT,
+    RECONNECT_MAX_SECONDS,
+    RECONNECT_MIN_SECONDS,
+)
+
+from .tools import json_dumps, json_loads
 from .types import SDInfo, SDWebsocketMessage
 
 _LOGGER = logging.getLogger(__name__)
 
+# Websocket connection states
+STATE_CONNECTING = "connecting"
+STATE_CONNECTED = "connected"
+STATE_WAITING = "waiting"
+STATE_STOPPED = "stopped"
+
 
 class StreamDeckApi:
     """Stream Deck API Class."""
@@ -27,6 +45,14 @@ class StreamDeckApi:
         on_status_update: any = None,
         on_ws_message: any = None,
         on_ws_connect: any = None,
+        session: any = None,
+        timeout: float = HTTP_TIMEOUT_SECONDS,
+        max_connections: int = HTTP_MAX_CONNECTIONS,
+        on_state_change: any = None,
+        reconnect_min_seconds: float = RECONNECT_MIN_SECONDS,
+        reconnect_max_seconds: float = RECONNECT_MAX_SECONDS,
+        cache: bool = False,
+        with_svg: bool = True,
     ) -> None:
         """Init Stream Deck API object.
 
@@ -36,6 +62,14 @@ class StreamDeckApi:
             on_status_update (Callable[[SDInfo], None] or None): Callback if status update received
             on_ws_message (Callable[[SDWebsocketMessage], None] or None): Callback if websocket message received
             on_ws_connect (Callable[[], None] or None): Callback on websocket connected
+            session (aiohttp.ClientSession or None): Shared HTTP session, a new one is created and closed by `close` if None
+            timeout (float): Timeout of HTTP requests in seconds
+            max_connections (int): Maximum number of concurrent HTTP requests
+            on_state_change (Callable[[str], None] or None): Callback if the websocket connection state changed
+            reconnect_min_seconds (float): Wait before reconnecting after the first failure
+            reconnect_max_seconds (float): Longest wait before reconnecting
+            cache (bool): Remember icons and info to skip unchanged updates and downloads
+            with_svg (bool): Keep the icons in received infos, only layout and uuids are kept otherwise
         """
 
         self._host = host
@@ -47,6 +81,31 @@ class StreamDeckApi:
         self._loop = asyncio.get_event_loop()
         self._running = False
         self._task: any = None
+        self._websocket: any = None
+        self._info: any = None
+        # Position in the event stream of the server, used to resume after reconnects
+        self._epoch: any = None
+        self._seq: any = None
+        self._subscription: dict = {}
+        self._request_ids = itertools.count(1)
+        self._requests: Dict[int, asyncio.Future] = {}
+        # Websocket commands the server supports, told by its connected message
+        self._commands: Set[str] = set()
+        self._session: any = session
+        self._owns_session = False
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._max_connections = max_connections
+        self._request_limit = asyncio.Semaphore(max_connections)
+        self._on_state_change = on_state_change
+        self._reconnect_min_seconds = reconnect_min_seconds
+        self._reconnect_max_seconds = reconnect_max_seconds
+        self._state = STATE_STOPPED
+        self._cache = cache
+        # Last known icon per uuid and entity tags of cached responses
+        self._icons: Dict[str, str] = {}
+        self._etags: Dict[str, str] = {}
+        self._cached_info: any = None
+        self._with_svg = with_svg
 
     #
     #   Properties
@@ -57,6 +116,24 @@ class StreamDeckApi:
         """Stream Deck API host."""
         return self._host
 
+    @property
+    def state(self) -> str:
+        """Websocket connection state.
+
+        Returns:
+            "connecting", "connected", "waiting" or "stopped"
+        """
+        return self._state
+
+    @property
+    def info(self) -> any:
+        """Last Stream Deck info received over the websocket.
+
+        Returns:
+            SDInfo or None
+        """
+        return self._info
+
     @property
     def _info_url(self) -> str:
         """URL to info endpoint."""
@@ -67,51 +144,91 @@ class StreamDeckApi:
         """URL to icon endpoint."""
         return f"http://{self._host}:{PLUGIN_PORT}{PLUGIN_ICON}/"
 
+    @property
+    def _icons_url(self) -> str:
+        """URL to batch icon endpoint."""
+        return f"http://{self._host}:{PLUGIN_PORT}{PLUGIN_ICONS}"
+
     @property
     def _websocket_url(self) -> str:
         """URL to websocket."""
         return f"ws://{self._host}:{PLUGIN_PORT}"
 
+    @property
+    def _resume_url(self) -> str:
+        """URL to websocket, resuming after the last received event."""
+        params = {name: ",".join(names) for name, names in self._subscription.items()}
+        if self._seq is not None:
+            params["since"] = self._seq
+            params["epoch"] = self._epoch
+            if isinstance(self._info, SDInfo):
+                params["version"] = self._info.version
+        if len(params) == 0:
+            return self._websocket_url
+        return f"{self._websocket_url}/?{urlencode(params)}"
+
     #
     #   API Methods
     #
 
-    @staticmethod
-    def _get_request(url: str) -> any:
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Get the HTTP session, creating one if none was given."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._max_connections)
+            )
+            self._owns_session = True
+        return self._session
+
+    async def _get_request(self, url: str, etag: any = None) -> any:
         """Handle GET requests.
 
+        Args:
+            url (str): URL to get
+            etag (str or None): Entity tag of the cached response, answered with 304 if unchanged
+
         Returns:
-            requests.Response or None
+            aiohttp.ClientResponse with its body read or None
         """
 
+        session = await self._get_session()
+        headers = {"If-None-Match": etag} if etag is not None else None
         try:
-            res = requests.get(url, timeout=5)
-        except requests.RequestException:
+            async with self._request_limit, session.get(
+                url, headers=headers, timeout=self._timeout
+            ) as res:
+                await res.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
             _LOGGER.debug(
                 "Error retrieving data from Stream Deck Plugin (exception). Is it offline?"
             )
             return None
-        if res.status_code != 200:
+        if res.status == 304 and etag is not None:
+            return res
+        if res.status != 200:
             _LOGGER.debug(
                 "Error retrieving data from Stream Deck Plugin (response code). Is it offline?"
             )
             return None
         return res
 
-    @staticmethod
-    def _post_request(url: str, data: str, headers) -> any:
+    async def _post_request(self, url: str, data: bytes, headers) -> any:
         """Handle POST requests.
-        
+
         Returns:
-            requests.Response or None
+            aiohttp.ClientResponse with its body read or None
         """
 
+        session = await self._get_session()
         try:
-            res = requests.post(url, data, headers=headers, timeout=5)
-        except requests.RequestException:
+            async with self._request_limit, session.post(
+                url, data=data, headers=headers, timeout=self._timeout
+            ) as res:
+                await res.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
             _LOGGER.debug("Error sending data to Stream Deck Plugin (exception)")
             return None
-        if res.status_code != 200:
+        if res.status != 200:
             _LOGGER.debug(
                 "Error sending data to Stream Deck Plugin (%s). Is the button currently visible?",
                 res.reason,
@@ -119,61 +236,193 @@ class StreamDeckApi:
             return None
         return res
 
+    async def ping(self) -> bool:
+        """Check if the server is reachable without downloading the info."""
+        session = await self._get_session()
+        try:
+            async with self._request_limit, session.head(
+                self._info_url, timeout=self._timeout
+            ) as res:
+                return res.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
     async def get_info(self, in_executor: bool = True) -> any:
         """Get info about Stream Deck.
-        
+
+        Args:
+            in_executor (bool): Unused, requests never block the event loop
+
         Returns:
             SDInfo or None
         """
 
-        res: any = None
-        if in_executor:
-            res = await self._loop.run_in_executor(
-                None, self._get_request, self._info_url
-            )
-        else:
-            res = self._get_request(self._info_url)
-        if res is None or res.status_code != 200:
+        etag = self._etags.get(self._info_url) if self._cached_info else None
+        res = await self._get_request(self._info_url, etag)
+        if res is None:
             return None
+        if res.status == 304:
+            return self._cached_info
         try:
-            rjson = res.json()
-        except requests.JSONDecodeError:
+            rjson = json_loads(await res.text())
+        except ValueError:
             _LOGGER.debug("Error decoding response from %s", self._info_url)
             return None
         try:
-            info = SDInfo(rjson)
+            info = SDInfo(rjson, self._with_svg)
         except KeyError:
             _LOGGER.debug("Error parsing response from %s to SDInfo", self._info_url)
             return None
+        if self._cache:
+            self._cached_info = info
+            self._remember_etag(self._info_url, res)
+            self._remember_icons(info["buttons"])
         return info
 
     async def get_icon(self, btn: str) -> any:
         """Get svg icon from Stream Deck button.
-        
+
+        Uses the websocket if connected, HTTP otherwise. With the cache, HTTP is
+        always used, so the cached icon is revalidated with its entity tag
+        instead of downloaded.
+
         Returns:
             str or None
         """
 
+        if not self._cache:
+            response = await self._ws_request("getIcon", {"uuid": btn})
+            if response is not None:
+                return response.get("svg") if response.get("ok") is True else None
+
         url = f"{self._icon_url}{btn}"
-        res = await self._loop.run_in_executor(None, self._get_request, url)
-        if res is None or res.status_code != 200:
+        etag = self._etags.get(url) if btn in self._icons else None
+        res = await self._get_request(url, etag)
+        if res is None:
             return None
-        if res.headers.get("Content-Type", "") != "image/svg+xml":
+        if res.status == 304:
+            return self._icons.get(btn)
+        if res.content_type != "image/svg+xml":
             _LOGGER.debug("Invalid content type received from %s", url)
             return None
-        return res.text
+        svg = await res.text()
+        if self._cache:
+            self._icons[btn] = svg
+            self._remember_etag(url, res)
+        return svg
 
     async def update_icon(self, btn: str, svg: str) -> bool:
-        """Update svg icon of Stream Deck button."""
-        url = f"{self._icon_url}{btn}"
-        res = await self._loop.run_in_executor(
-            None,
-            self._post_request,
-            url,
-            svg.encode("utf-8"),
-            {"Content-Type": "image/svg+xml"},
-        )
-        return isinstance(res, requests.Response) and res.status_code == 200
+        """Update svg icon of Stream Deck button.
+
+        Uses the websocket if connected, HTTP otherwise. With the cache, icons
+        the button already shows aren't sent again.
+        """
+        if self._cache and self._icons.get(btn) == svg:
+            return True
+
+        response = await self._ws_request("setIcon", {"uuid": btn, "svg": svg})
+        if response is not None:
+            updated = response.get("ok") is True
+        else:
+            res = await self._post_request(
+                f"{self._icon_url}{btn}",
+                svg.encode("utf-8"),
+                {"Content-Type": "image/svg+xml"},
+            )
+            updated = res is not None
+        self._update_cached_icon(btn, svg, updated)
+        return updated
+
+    async def update_icons(self, icons: Dict[str, str]) -> Dict[str, bool]:
+        """Update svg icons of multiple Stream Deck buttons at once.
+
+        Uses a single websocket message if connected, a single HTTP request
+        otherwise.
+
+        Args:
+            icons (Dict[str, str]): Svg icons by button uuid
+
+        Returns:
+            Dict[str, bool]: If the icon of a button was updated
+        """
+        changed_icons = {
+            btn: svg
+            for btn, svg in icons.items()
+            if not self._cache or self._icons.get(btn) != svg
+        }
+        if len(changed_icons) == 0:
+            return {btn: True for btn in icons}
+
+        response = await self._ws_request("setIcons", {"icons": changed_icons})
+        if response is None:
+            res = await self._post_request(
+                self._icons_url,
+                json_dumps(changed_icons).encode("utf-8"),
+                {"Content-Type": "application/json"},
+            )
+            try:
+                response = json_loads(await res.text()) if res is not None else {}
+            except ValueError:
+                _LOGGER.debug("Error decoding response from %s", self._icons_url)
+                response = {}
+
+        results = response.get("results", {})
+        updated = {}
+        for btn, svg in icons.items():
+            if btn in changed_icons:
+                updated[btn] = results.get(btn) in ("changed", "unchanged")
+                self._update_cached_icon(btn, svg, updated[btn])
+            else:
+                updated[btn] = True
+        return updated
+
+    #
+    #   Cache
+    #
+
+    def _remember_etag(self, url: str, res: any):
+        """Remember the entity tag of a response."""
+        etag = res.headers.get("ETag")
+        if etag is None:
+            self._etags.pop(url, None)
+        else:
+            self._etags[url] = etag
+
+    def _remember_icons(self, buttons: dict):
+        """Remember the icons of the raw buttons of a status or delta.
+
+        Buttons without their svg may have changed, their icons are forgotten.
+        """
+        # The raw buttons don't need to be turned into SDButtons for this
+        for button in buttons.values():
+            if button.get("svg") is not None:
+                self._icons[button["uuid"]] = button["svg"]
+            else:
+                self._icons.pop(button["uuid"], None)
+
+    def _update_cached_icon(self, btn: str, svg: str, updated: bool):
+        """Remember a sent icon, or forget the icon if sending failed."""
+        if not self._cache:
+            return
+        if updated:
+            self._icons[btn] = svg
+        else:
+            self._icons.pop(btn, None)
+
+    async def close(self):
+        """Stop the websocket client and close the HTTP session if it was created here."""
+        self.stop_websocket_loop()
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self) -> "StreamDeckApi":
+        """Enter the async context."""
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        """Close on exit of the async context."""
+        await self.close()
 
     #
     #   Websocket Methods
@@ -195,19 +444,134 @@ class StreamDeckApi:
         elif state is False and self._on_button_release is not None:
             self._on_button_release(uuid)
 
-    def _on_ws_status_update(self, info: any):
+    def _on_ws_status_update(self, info: any, changed_buttons: any = None):
         """Handle Stream Deck status update event.
         
         Args:
             info (SDInfo or str or dict): Stream Deck Info
+            changed_buttons (dict or None): Raw buttons of a delta, all if None
         """
 
         if not isinstance(info, SDInfo):
             _LOGGER.debug("Method _on_ws_status_update: info is not SDInfo")
             return
+        self._info = info
+        if self._cache:
+            self._remember_icons(
+                info["buttons"] if changed_buttons is None else changed_buttons
+            )
+        self._send_ws_message("statusAck", {"version": info.version})
         if self._on_status_update is not None:
             self._on_status_update(info)
 
+    def _on_ws_status_delta(self, delta: any):
+        """Handle Stream Deck status delta event.
+
+        Args:
+            delta (dict): Changes since the acknowledged version
+        """
+
+        if not isinstance(delta, dict):
+            _LOGGER.debug("Method _on_ws_status_delta: delta is not dict")
+            return
+        known_version = self._info.version if isinstance(self._info, SDInfo) else -1
+        if known_version < delta.get("since", 0):
+            # Changes are missing, start over
+            self._send_ws_message("getStatus", {})
+            return
+        try:
+            self._info.apply_delta(delta)
+        except (KeyError, TypeError):
+            _LOGGER.debug("Method _on_ws_status_delta: delta couldn't get applied")
+            self._send_ws_message("getStatus", {})
+            return
+        self._on_ws_status_update(self._info, delta["buttons"])
+
+    def _on_ws_connected(self, args: any):
+        """Handle websocket connected event.
+
+        Args:
+            args (dict): Position in the event stream of the server
+        """
+
+        if not isinstance(args, dict):
+            return
+        commands = args.get("commands")
+        if not isinstance(commands, list):
+            commands = []
+        self._commands = {command for command in commands if isinstance(command, str)}
+        if not args.get("resumed", False):
+            # Missed events are lost, the status sent next starts over
+            self._epoch = args.get("epoch")
+            self._seq = args.get("seq")
+        if self._on_ws_connect is not None:
+            self._on_ws_connect()
+
+    def subscribe(
+        self,
+        devices: any = None,
+        buttons: any = None,
+        events: any = None,
+    ):
+        """Only receive events and status of some devices, buttons or events.
+
+        Args:
+            devices (List[str] or None): Device ids, None for all
+            buttons (List[str] or None): Button uuids, None for all
+            events (List[str] or None): Event names like "keyDown", None for all
+        """
+
+        self._subscription = {
+            name: list(names)
+            for name, names in (
+                ("devices", devices),
+                ("buttons", buttons),
+                ("events", events),
+            )
+            if names is not None
+        }
+        self._send_ws_message("subscribe", self._subscription)
+
+    async def _ws_request(self, event: str, args: any, timeout: float = 5) -> any:
+        """Send a command over the websocket and wait for its response.
+
+        Returns:
+            dict or None if not connected, the server doesn't support the
+            command or no response was received
+        """
+
+        if self._websocket is None or event not in self._commands:
+            return None
+        request_id = next(self._request_ids)
+        future = self._loop.create_future()
+        self._requests[request_id] = future
+        try:
+            await self._websocket.send(
+                json_dumps({"event": event, "id": request_id, "args": args})
+            )
+            return await asyncio.wait_for(future, timeout)
+        except (WebSocketException, asyncio.TimeoutError):
+            _LOGGER.debug("Method _ws_request: No response to %s", event)
+            return None
+        finally:
+            self._requests.pop(request_id, None)
+
+    def _on_ws_response(self, request_id: any, args: any):
+        """Handle response to a websocket command."""
+        future = self._requests.get(request_id)
+        if future is None or future.done():
+            _LOGGER.debug("Method _on_ws_response: Unknown request %s", request_id)
+            return
+        future.set_result(args if isinstance(args, dict) else None)
+
+    def _send_ws_message(self, event: str, args: any):
+        """Send a message to the server without waiting for it."""
+        if self._websocket is None:
+            return
+        asyncio.ensure_future(
+            self._websocket.send(json_dumps({"event": event, "args": args}))
+        )
+
     def _on_message(self, msg: str):
         """Handle websocket messages."""
         if not isinstance(msg, str):
@@ -216,12 +580,12 @@ class StreamDeckApi:
         _LOGGER.debug(msg)
 
         try:
-            datajson = json.loads(msg)
-        except json.JSONDecodeError:
+            datajson = json_loads(msg)
+        except ValueError:
             _LOGGER.debug("Method _on_message: Websocket message couldn't get parsed")
             return
         try:
-            data = SDWebsocketMessage(datajson)
+            data = SDWebsocketMessage(datajson, self._with_svg)
         except KeyError:
             _LOGGER.debug(
                 "Method _on_message: Websocket message couldn't get parsed to SDWebsocketMessage"
@@ -230,6 +594,9 @@ class StreamDeckApi:
 
         _LOGGER.debug("Method _on_message: Got event %s", data.event)
 
+        if isinstance(datajson.get("seq"), int):
+            self._seq = datajson["seq"]
+
         if self._on_ws_message is not None:
             self._on_ws_message(data)
 
@@ -239,43 +606,87 @@ class StreamDeckApi:
             self._on_button_change(data.args, False)
         elif data.event == "status":
             self._on_ws_status_update(data.args)
+        elif data.event == "statusDelta":
+            self._on_ws_status_delta(data.args)
+        elif data.event == "response":
+            self._on_ws_response(datajson.get("id"), data.args)
+        elif data.event == "connected":
+            self._on_ws_connected(data.args)
+        elif data.event == "heartbeat":
+            pass
         else:
             _LOGGER.debug(
                 "Method _on_message: Unknown event from Stream Deck Plugin received (Event: %s)",
                 data.event,
             )
 
+    def _set_state(self, state: str):
+        """Change the connection state and tell the callback."""
+        if state == self._state:
+            return
+        _LOGGER.debug("Method _set_state: %s -> %s", self._state, state)
+        self._state = state
+        if self._on_state_change is not None:
+            self._on_state_change(state)
+
+    def _get_backoff(self, failures: int) -> float:
+        """Get the seconds to wait after a number of failed connection attempts.
+
+        The delay doubles with each failure up to the maximum, the jitter keeps
+        many clients from reconnecting at the same time after a server restart.
+        """
+        delay = min(
+            self._reconnect_max_seconds,
+            self._reconnect_min_seconds * 2 ** min(failures - 1, 16),
+        )
+        return random.uniform(delay / 2, delay)
+
     async def _websocket_loop(self):
         """Start the websocket client loop."""
         self._running = True
-        while self._running:
-            info = await self.get_info()
-            if isinstance(info, SDInfo):
+        failures = 0
+        try:
+            while self._running:
+                if failures > 0:
+                    self._set_state(STATE_WAITING)
+                    await asyncio.sleep(self._get_backoff(failures))
+                self._set_state(STATE_CONNECTING)
+                if not await self.ping():
+                    _LOGGER.debug("Method _websocket_loop: Streamdeck offline")
+                    failures += 1
+                    continue
+
                 _LOGGER.debug("Method _websocket_loop: Streamdeck online")
+                failures += 1
                 try:
-                    async with connect(self._websocket_url) as websocket:
-                        if self._on_ws_connect is not None:
-                            self._on_ws_connect()
-                        try:
-                            while self._running:
-                                data = await asyncio.wait_for(
-                                    websocket.recv(), timeout=60
-                                )
-                                self._on_message(data)
-                            await websocket.close()
-                            _LOGGER.debug("Method _websocket_loop: Websocket closed")
-                        except WebSocketException:
-                            _LOGGER.debug(
-                                "Method _websocket_loop: Websocket client crashed. Restarting it"
-                            )
-                        except asyncio.TimeoutError:
-                            _LOGGER.debug(
-                                "Method _websocket_loop: Websocket client timed out. Restarting it"
-                            )
-                except WebSocketException:
+                    # Resuming clients get the missed events instead of a full download
+                    async with connect(self._resume_url) as websocket:
+                        self._websocket = websocket
+                        self._set_state(STATE_CONNECTED)
+                        failures = 0
+                        while self._running:
+                            data = await asyncio.wait_for(websocket.recv(), timeout=60)
+                            self._on_message(data)
+                        _LOGGER.debug("Method _websocket_loop: Websocket closed")
+                except (WebSocketException, OSError):
+                    _LOGGER.debug(
+                        "Method _websocket_loop: Websocket client crashed. Restarting it"
+                    )
+                except asyncio.TimeoutError:
                     _LOGGER.debug(
-                        "Method _websocket_loop: Websocket client not connecting. Restarting it"
+                        "Method _websocket_loop: Websocket client timed out. Restarting it"
                     )
+                finally:
+                    self._websocket = None
+                    self._commands = set()
+                    for future in self._requests.values():
+                        if not future.done():
+                            future.set_result(None)
+                if failures == 0:
+                    # The connection was lost, retry soon
+                    failures = 1
+        finally:
+            self._set_state(STATE_STOPPED)
 
     def start_websocket_loop(self):
         """Start the websocket client."""
@@ -284,3 +695,6 @@ class StreamDeckApi:
     def stop_websocket_loop(self):
         """Stop the websocket client."""
         self._running = False
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
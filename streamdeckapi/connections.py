@@ -0,0 +1,302 @@
+"""Stream Deck API websocket connections."""
+
+import asyncio
+from collections import deque
+from typing import Deque, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from aiohttp import web
+
+from streamdeckapi.const import (
+    EVENT_BUFFER_SIZE,
+    WS_MAX_DROPS,
+    WS_QUEUE_SIZE,
+    WS_SEND_TIMEOUT,
+)
+from streamdeckapi.tools import json_dumps
+
+
+class Subscription:
+    """Devices, buttons and events a websocket client is interested in.
+
+    None means all of them. A button matches if it is named or on a named
+    device.
+    """
+
+    def __init__(self, obj: Optional[dict] = None) -> None:
+        """Init subscription from a subscribe message or query."""
+        obj = obj or {}
+        self.devices = self._names(obj, "devices")
+        self.buttons = self._names(obj, "buttons")
+        self.events = self._names(obj, "events")
+
+    @staticmethod
+    def _names(obj: dict, name: str) -> Optional[FrozenSet[str]]:
+        value = obj.get(name)
+        if value is None:
+            return None
+        if isinstance(value, str):
+            value = value.split(",")
+        if not isinstance(value, list) or not all(
+            isinstance(item, str) for item in value
+        ):
+            raise ValueError(f"{name} has to be a list of strings")
+        return frozenset(value)
+
+    @property
+    def filters_buttons(self) -> bool:
+        """Only some buttons are subscribed."""
+        return self.devices is not None or self.buttons is not None
+
+    def matches_button(self, uuid: str, device: str) -> bool:
+        """Check if a button is subscribed."""
+        if not self.filters_buttons:
+            return True
+        return (self.buttons is not None and uuid in self.buttons) or (
+            self.devices is not None and device in self.devices
+        )
+
+    def matches(self, uuid: str, device: str, event: str) -> bool:
+        """Check if an event of a button is subscribed."""
+        return (self.events is None or event in self.events) and self.matches_button(
+            uuid, device
+        )
+
+    def to_dict(self) -> dict:
+        """Get the wire representation."""
+        return {
+            name: sorted(value)
+            for name, value in (
+                ("devices", self.devices),
+                ("buttons", self.buttons),
+                ("events", self.events),
+            )
+            if value is not None
+        }
+
+
+class EventBuffer:
+    """Numbered button events with a bounded history of the most recent ones.
+
+    Clients resuming after a reconnect get the events they missed replayed,
+    as long as those are still in the history.
+    """
+
+    def __init__(self, size: int = EVENT_BUFFER_SIZE) -> None:
+        """Init event buffer."""
+        self.seq = 0
+        self._events: Deque[Tuple[int, str, str, str, str]] = deque(maxlen=size)
+
+    def add(self, event: str, uuid: str, device: str) -> str:
+        """Number an event of a button and keep it in the history.
+
+        Returns:
+            str: Event as websocket message
+        """
+        self.seq += 1
+        message = json_dumps({"event": event, "args": uuid, "seq": self.seq})
+        self._events.append((self.seq, event, uuid, device, message))
+        return message
+
+    def since(
+        self, seq: int, subscription: Optional[Subscription] = None
+    ) -> Optional[List[str]]:
+        """Get the events after a sequence number as websocket messages.
+
+        Returns:
+            list or None if some of the events aren't in the history anymore
+        """
+        if seq < 0 or seq > self.seq:
+            return None
+        if seq == self.seq:
+            return []
+        if len(self._events) == 0 or self._events[0][0] > seq + 1:
+            return None
+        return [
+            message
+            for event_seq, event, uuid, device, message in self._events
+            if event_seq > seq
+            and (subscription is None or subscription.matches(uuid, device, event))
+        ]
+
+
+class Subscriptions:
+    """Index from buttons, devices and events to the subscribed clients."""
+
+    def __init__(self) -> None:
+        """Init subscriptions."""
+        self._subscriptions: Dict["WebsocketClient", Subscription] = {}
+        self._all_buttons: Set["WebsocketClient"] = set()
+        self._buttons: Dict[str, Set["WebsocketClient"]] = {}
+        self._devices: Dict[str, Set["WebsocketClient"]] = {}
+        self._all_events: Set["WebsocketClient"] = set()
+        self._events: Dict[str, Set["WebsocketClient"]] = {}
+
+    def get(self, client: "WebsocketClient") -> Subscription:
+        """Get the subscription of a client."""
+        return self._subscriptions.get(client) or Subscription()
+
+    def add(
+        self, client: "WebsocketClient", subscription: Optional[Subscription] = None
+    ):
+        """Subscribe a client, replacing its previous subscription."""
+        self.remove(client)
+        subscription = subscription or Subscription()
+        self._subscriptions[client] = subscription
+        if not subscription.filters_buttons:
+            self._all_buttons.add(client)
+        for uuid in subscription.buttons or ():
+            self._buttons.setdefault(uuid, set()).add(client)
+        for device in subscription.devices or ():
+            self._devices.setdefault(device, set()).add(client)
+        if subscription.events is None:
+            self._all_events.add(client)
+        for event in subscription.events or ():
+            self._events.setdefault(event, set()).add(client)
+
+    def remove(self, client: "WebsocketClient"):
+        """Unsubscribe a client."""
+        subscription = self._subscriptions.pop(client, None)
+        if subscription is None:
+            return
+        self._all_buttons.discard(client)
+        self._all_events.discard(client)
+        for index, names in (
+            (self._buttons, subscription.buttons),
+            (self._devices, subscription.devices),
+            (self._events, subscription.events),
+        ):
+            for name in names or ():
+                index[name].discard(client)
+                if len(index[name]) == 0:
+                    del index[name]
+
+    def clients(self, uuid: str, device: str, event: str) -> Set["WebsocketClient"]:
+        """Get the clients subscribed to an event of a button."""
+        clients = self._all_buttons.union(
+            self._buttons.get(uuid, ()), self._devices.get(device, ())
+        )
+        return clients.intersection(self._all_events.union(self._events.get(event, ())))
+
+
+class WebsocketClient:
+    """Websocket client with a bounded send queue and its own writer task.
+
+    When the queue is full, queued droppable messages (status updates) make
+    room first. Key events are never dropped: a client that cannot take them
+    anymore is disconnected, as is a client that dropped too many messages
+    within an interval or does not accept a message within the send timeout.
+    """
+
+    def __init__(
+        self,
+        web_socket: web.WebSocketResponse,
+        max_queue: int = WS_QUEUE_SIZE,
+        max_drops: int = WS_MAX_DROPS,
+        send_timeout: float = WS_SEND_TIMEOUT,
+    ) -> None:
+        """Init websocket client."""
+        self.web_socket = web_socket
+        self.max_queue = max_queue
+        self.max_drops = max_drops
+        self.send_timeout = send_timeout
+        self.drops = 0
+        # Drops since the last call of take_interval_drops
+        self.interval_drops = 0
+        # Status version acknowledged by clients that understand status deltas
+        self.acked_version: Optional[int] = None
+        # Status version last sent to all other clients
+        self.sent_version: Optional[int] = None
+        self._queue: Deque[Tuple[str, bool]] = deque()
+        self._ready = asyncio.Event()
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def depth(self) -> int:
+        """Number of queued messages."""
+        return len(self._queue)
+
+    def start(self):
+        """Start the writer task."""
+        self._task = asyncio.ensure_future(self._run())
+
+    def send(self, message: str, droppable: bool = False) -> bool:
+        """Queue a message, never blocks.
+
+        Args:
+            message (str): Message to send
+            droppable (bool): The message may be dropped if the client is slow
+
+        Returns:
+            False if the message was dropped
+        """
+        if self._closing:
+            return False
+        if len(self._queue) >= self.max_queue:
+            if not self._make_room():
+                if droppable:
+                    self._count_drop()
+                    return False
+                print("Websocket client too slow for key events, disconnecting")
+                self.close()
+                return False
+            if self._closing:
+                return False
+        self._queue.append((message, droppable))
+        self._ready.set()
+        return True
+
+    def _make_room(self) -> bool:
+        """Drop the oldest queued droppable message."""
+        for index, (_, droppable) in enumerate(self._queue):
+            if droppable:
+                del self._queue[index]
+                self._count_drop()
+                return True
+        return False
+
+    def _count_drop(self):
+        self.drops += 1
+        self.interval_drops += 1
+        if self.interval_drops >= self.max_drops:
+            print(
+                f"Websocket client dropped {self.interval_drops} messages, "
+                "disconnecting"
+            )
+            self.close()
+
+    def take_interval_drops(self) -> int:
+        """Get the drops since the last call and start a new interval."""
+        drops = self.interval_drops
+        self.interval_drops = 0
+        return drops
+
+    async def _run(self):
+        while True:
+            await self._ready.wait()
+            while len(self._queue) > 0:
+                message, _ = self._queue.popleft()
+                try:
+                    await asyncio.wait_for(
+                        self.web_socket.send_str(message), self.send_timeout
+                    )
+                except (asyncio.TimeoutError, ConnectionError, RuntimeError):
+                    print("Websocket client not responding, disconnecting")
+                    self.close()
+                    return
+            self._ready.clear()
+
+    def close(self):
+        """Disconnect the client."""
+        if self._closing:
+            return
+        self._closing = True
+        self._queue.clear()
+        asyncio.ensure_future(self.web_socket.close())
+
+    def stop(self):
+        """Stop the writer task."""
+        self._closing = True
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -3,9 +3,39 @@
 PLUGIN_PORT = 6153
 PLUGIN_INFO = "/sd/info"
 PLUGIN_ICON = "/sd/icon"
+PLUGIN_ICONS = "/sd/icons"
+PLUGIN_CONFIG = "/sd/config"
+PLUGIN_STATS = "/sd/stats"
+PLUGIN_METRICS = "/metrics"
 
 DB_FILE = "data/streamdeckapi.db"
 SD_SSDP = "urn:home-assistant-device:stream-deck"
 SD_ZEROCONF = "_stream-deck-api._tcp.local."
 DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
 LONG_PRESS_SECONDS = 2
+LONG_PRESS_MS = LONG_PRESS_SECONDS * 1000
+# Off by default, waiting for a second tap delays every singleTap
+DOUBLE_TAP_MS = 0
+HOLD_REPEAT_MS = 0
+DB_FLUSH_SECONDS = 2
+# Models of fake decks, their key layouts are in streamdeckapi.fake
+FAKE_DECK_MODELS = ("mini", "original", "mk2", "xl", "plus")
+RENDER_CACHE_ENTRIES = 512
+RENDER_CACHE_BYTES = 16 * 1024 * 1024
+RENDER_EXECUTOR = "process"
+RENDER_WORKERS = 2
+MIN_FRAME_INTERVAL_MS = 0
+NO_CONN_GRACE_SECONDS = 3
+WS_QUEUE_SIZE = 64
+WS_MAX_DROPS = 100
+# Dropped messages are logged, and limited by WS_MAX_DROPS, per interval
+WS_DROP_INTERVAL_SECONDS = 10
+WS_SEND_TIMEOUT = 10
+WS_HEARTBEAT_SECONDS = 30
+# Commands clients may send over the websocket instead of HTTP requests
+WS_COMMANDS = ("setIcon", "setIcons", "getIcon")
+EVENT_BUFFER_SIZE = 256
+HTTP_TIMEOUT_SECONDS = 5
+HTTP_MAX_CONNECTIONS = 4
+RECONNECT_MIN_SECONDS = 1
+RECONNECT_MAX_SECONDS = 60
@@ -0,0 +1,224 @@
+"""Stream Deck API fake devices."""
+
+import queue
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from StreamDeck.Devices.StreamDeck import StreamDeck
+from StreamDeck.Devices.StreamDeckMini import StreamDeckMini
+from StreamDeck.Devices.StreamDeckOriginal import StreamDeckOriginal
+from StreamDeck.Devices.StreamDeckOriginalV2 import StreamDeckOriginalV2
+from StreamDeck.Devices.StreamDeckXL import StreamDeckXL
+
+_LAYOUT_ATTRIBUTES = (
+    "DECK_TYPE",
+    "DECK_VISUAL",
+    "KEY_COUNT",
+    "KEY_COLS",
+    "KEY_ROWS",
+    "KEY_PIXEL_WIDTH",
+    "KEY_PIXEL_HEIGHT",
+    "KEY_IMAGE_FORMAT",
+    "KEY_FLIP",
+    "KEY_ROTATION",
+)
+
+
+def _layout(deck_class: type, **overrides) -> dict:
+    """Get the key layout of a deck class of the StreamDeck library."""
+    layout = {name: getattr(deck_class, name) for name in _LAYOUT_ATTRIBUTES}
+    layout.update(overrides)
+    return layout
+
+
+# Key layouts by model, the same as FAKE_DECK_MODELS in const. The Stream Deck +
+# is simulated without its dials.
+LAYOUTS: Dict[str, dict] = {
+    "mini": _layout(StreamDeckMini),
+    "original": _layout(StreamDeckOriginal),
+    "mk2": _layout(StreamDeckOriginalV2, DECK_TYPE="Stream Deck MK.2"),
+    "xl": _layout(StreamDeckXL),
+    "plus": {
+        "DECK_TYPE": "Stream Deck +",
+        "DECK_VISUAL": True,
+        "KEY_COUNT": 8,
+        "KEY_COLS": 4,
+        "KEY_ROWS": 2,
+        "KEY_PIXEL_WIDTH": 120,
+        "KEY_PIXEL_HEIGHT": 120,
+        "KEY_IMAGE_FORMAT": "JPEG",
+        "KEY_FLIP": (False, False),
+        "KEY_ROTATION": 0,
+    },
+}
+
+# Seconds a read waits for a scripted key change, like a HID read timeout
+_READ_TIMEOUT = 0.1
+
+
+class FakeStreamDeck(StreamDeck):
+    """In-memory Stream Deck, usable wherever the server expects a USB deck.
+
+    Key images are kept per key instead of being sent to a device, each write
+    takes the configured latency. Key presses are scripted with `press`,
+    `release`, `tap` and `play` and reach the key callback through the reader
+    thread of the StreamDeck library, like those of a real deck.
+    """
+
+    def __init__(
+        self, model: str = "xl", serial: str = "FAKE0", write_latency: float = 0
+    ) -> None:
+        """Init fake deck.
+
+        Args:
+            model (str): Key layout, one of LAYOUTS
+            serial (str): Serial number
+            write_latency (float): Seconds each key image write takes
+        """
+        if model not in LAYOUTS:
+            raise ValueError(f"Unknown Stream Deck model {model}")
+        self.model = model
+        for name, value in LAYOUTS[model].items():
+            setattr(self, name, value)
+        super().__init__(None)
+        self.serial = serial
+        self.write_latency = write_latency
+        self.images: Dict[int, bytes] = {}
+        self.writes = 0
+        self.brightness = 100
+        self._open = False
+        self._pressed = [False] * self.KEY_COUNT
+        self._states: queue.Queue = queue.Queue()
+
+    def __del__(self):
+        """Stop the reader thread."""
+        self.close()
+
+    #
+    #   Device
+    #
+
+    def open(self):
+        """Open the deck and start the reader thread."""
+        self._open = True
+        self._setup_reader(self._read)
+
+    def close(self):
+        """Close the deck and stop the reader thread."""
+        self._open = False
+        self._setup_reader(None)
+
+    def is_open(self) -> bool:
+        """Tell if the deck is open."""
+        return self._open
+
+    def connected(self) -> bool:
+        """Fake decks are always connected."""
+        return True
+
+    def vendor_id(self) -> int:
+        """Get the vendor id of Elgato."""
+        return 0x0FD9
+
+    def product_id(self) -> int:
+        """Fake decks have no product id."""
+        return 0
+
+    def id(self) -> str:
+        """Get the id of the deck, unique per serial number."""
+        return f"fake:{self.serial}"
+
+    def get_serial_number(self) -> str:
+        """Get the serial number."""
+        return self.serial
+
+    def get_firmware_version(self) -> str:
+        """Get the firmware version."""
+        return f"fake-{self.model}"
+
+    def reset(self):
+        """Blank all keys."""
+        self.images.clear()
+
+    def set_brightness(self, percent):
+        """Set the brightness."""
+        self.brightness = percent
+
+    def set_key_image(self, key: int, image):
+        """Keep the image of a key, taking the write latency."""
+        if not 0 <= key < self.KEY_COUNT:
+            raise IndexError(f"Invalid key index {key}.")
+        if self.write_latency > 0:
+            time.sleep(self.write_latency)
+        self.images[key] = bytes(image or b"")
+        self.writes += 1
+
+    def _reset_key_stream(self):
+        pass
+
+    def _read_key_states(self) -> List[bool]:
+        try:
+            return self._states.get(timeout=_READ_TIMEOUT)
+        except queue.Empty:
+            return self.last_key_states
+
+    #
+    #   Scripted key presses
+    #
+
+    def press(self, key: int, pressed: bool = True):
+        """Press or release a key, never blocks."""
+        if not 0 <= key < self.KEY_COUNT:
+            raise IndexError(f"Invalid key index {key}.")
+        self._pressed[key] = pressed
+        self._states.put(list(self._pressed))
+
+    def release(self, key: int):
+        """Release a key, never blocks."""
+        self.press(key, False)
+
+    def tap(self, key: int):
+        """Press and release a key, never blocks."""
+        self.press(key)
+        self.release(key)
+
+    def play(self, script: Iterable[Tuple[float, int, bool]]) -> threading.Thread:
+        """Play key changes on a background thread.
+
+        Args:
+            script (Iterable[Tuple[float, int, bool]]): Seconds to wait before
+                each change, key and whether it is pressed
+
+        Returns:
+            threading.Thread: Thread playing the script
+        """
+
+        def run():
+            for delay, key, pressed in script:
+                time.sleep(delay)
+                self.press(key, pressed)
+
+        thread = threading.Thread(
+            target=run, name=f"streamdeckapi-fake-{self.serial}", daemon=True
+        )
+        thread.start()
+        return thread
+
+
+def create_fake_decks(
+    models: Iterable[str], write_latency: float = 0, serials: Optional[List[str]] = None
+) -> List[FakeStreamDeck]:
+    """Create fake decks, numbered serial numbers keep their buttons across runs.
+
+    Args:
+        models (Iterable[str]): Model of each deck, one of LAYOUTS
+        write_latency (float): Seconds each key image write takes
+        serials (List[str] or None): Serial numbers, FAKE0, FAKE1, ... if None
+    """
+    models = list(models)
+    serials = serials or [f"FAKE{index}" for index in range(len(models))]
+    return [
+        FakeStreamDeck(model, serial, write_latency)
+        for model, serial in zip(models, serials)
+    ]
@@ -0,0 +1,259 @@
+"""Stream Deck API key handling."""
+
+import asyncio
+import json
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from streamdeckapi.const import (
+    DATETIME_FORMAT,
+    DOUBLE_TAP_MS,
+    HOLD_REPEAT_MS,
+    LONG_PRESS_MS,
+)
+from streamdeckapi.registry import ButtonKey
+
+
+class GestureConfig:
+    """Gesture thresholds of a button in milliseconds, 0 disables a gesture."""
+
+    long_press_ms: int
+    double_tap_ms: int
+    hold_repeat_ms: int
+
+    def __init__(self, obj: Optional[dict] = None) -> None:
+        """Init gesture config object.
+
+        Raises:
+            ValueError: A threshold is not a positive number
+        """
+        if obj is None:
+            obj = {}
+        self.long_press_ms = self._threshold(obj, "longPressMs", LONG_PRESS_MS)
+        self.double_tap_ms = self._threshold(obj, "doubleTapMs", DOUBLE_TAP_MS)
+        self.hold_repeat_ms = self._threshold(obj, "holdRepeatMs", HOLD_REPEAT_MS)
+
+    @staticmethod
+    def _threshold(obj: dict, name: str, default: int) -> int:
+        value = obj.get(name, default)
+        if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+            raise ValueError(f"{name} has to be a positive number")
+        return value
+
+    def to_dict(self) -> dict:
+        """Get the wire representation."""
+        return {
+            "longPressMs": self.long_press_ms,
+            "doubleTapMs": self.double_tap_ms,
+            "holdRepeatMs": self.hold_repeat_ms,
+        }
+
+
+class KeyState:
+    """State of a single key."""
+
+    def __init__(self) -> None:
+        """Init key state."""
+        self.pressed = False
+        self.since = time.monotonic()
+        self.presses = 0
+        self.long_pressed = False
+        self.second_tap = False
+        self.long_press_timer: Optional[asyncio.TimerHandle] = None
+        self.repeat_timer: Optional[asyncio.TimerHandle] = None
+        self.tap_timer: Optional[asyncio.TimerHandle] = None
+
+    def cancel(self):
+        """Cancel all pending timers."""
+        for timer in (self.long_press_timer, self.repeat_timer, self.tap_timer):
+            if timer is not None:
+                timer.cancel()
+        self.long_press_timer = None
+        self.repeat_timer = None
+        self.tap_timer = None
+
+
+class KeyStateMachine:
+    """In-memory states of all keys, timed with a monotonic clock."""
+
+    def __init__(self) -> None:
+        """Init key state machine."""
+        self._states: Dict[ButtonKey, KeyState] = {}
+
+    def get(self, key: ButtonKey) -> KeyState:
+        """Get the state of a key."""
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = KeyState()
+        return state
+
+    def update(self, key: ButtonKey, pressed: bool) -> Tuple[bool, float]:
+        """Record a key change.
+
+        Returns:
+            Previous state and the seconds spent in it
+        """
+        state = self.get(key)
+        now = time.monotonic()
+        previous = (state.pressed, now - state.since)
+        state.pressed = pressed
+        state.since = now
+        if pressed:
+            state.presses += 1
+        return previous
+
+
+class GestureRecognizer(KeyStateMachine):
+    """Detect taps, double taps, long presses and hold repeats.
+
+    Gestures are timed with cancellable event loop timers, the emit callback
+    receives the key and one of `singleTap`, `doubleTap`, `longPress` or
+    `holdRepeat`.
+    """
+
+    def __init__(self, emit: Callable[[ButtonKey, str], None]) -> None:
+        """Init gesture recognizer."""
+        super().__init__()
+        self._emit = emit
+        self._configs: Dict[ButtonKey, GestureConfig] = {}
+        self.default_config = GestureConfig()
+
+    def config(self, key: ButtonKey) -> GestureConfig:
+        """Get the gesture config of a key."""
+        return self._configs.get(key, self.default_config)
+
+    def configure(self, key: ButtonKey, config: GestureConfig):
+        """Set the gesture config of a key."""
+        self._configs[key] = config
+
+    def key_down(self, key: ButtonKey):
+        """Handle a pressed key."""
+        self.update(key, True)
+        state = self.get(key)
+        config = self.config(key)
+        loop = asyncio.get_running_loop()
+
+        state.long_pressed = False
+        if state.tap_timer is not None:
+            # Pressed again within the double tap window
+            state.tap_timer.cancel()
+            state.tap_timer = None
+            state.second_tap = True
+        if config.long_press_ms > 0:
+            state.long_press_timer = loop.call_later(
+                config.long_press_ms / 1000, self._on_long_press, key
+            )
+
+    def key_up(self, key: ButtonKey):
+        """Handle a released key."""
+        last_state, _ = self.update(key, False)
+        if last_state is False:
+            return
+        state = self.get(key)
+        state.cancel()
+        if state.long_pressed:
+            return
+
+        if state.second_tap:
+            state.second_tap = False
+            self._emit(key, "doubleTap")
+            return
+
+        double_tap_ms = self.config(key).double_tap_ms
+        if double_tap_ms == 0:
+            self._emit(key, "singleTap")
+            return
+        state.tap_timer = asyncio.get_running_loop().call_later(
+            double_tap_ms / 1000, self._on_tap_timeout, key
+        )
+
+    def cancel(self):
+        """Cancel the timers of all keys."""
+        for state in self._states.values():
+            state.cancel()
+
+    def _on_tap_timeout(self, key: ButtonKey):
+        self.get(key).tap_timer = None
+        self._emit(key, "singleTap")
+
+    def _on_long_press(self, key: ButtonKey):
+        state = self.get(key)
+        state.long_press_timer = None
+        state.long_pressed = True
+        if state.second_tap:
+            # The first tap was a tap after all
+            state.second_tap = False
+            self._emit(key, "singleTap")
+        self._emit(key, "longPress")
+        self._schedule_repeat(key)
+
+    def _on_repeat(self, key: ButtonKey):
+        self.get(key).repeat_timer = None
+        self._emit(key, "holdRepeat")
+        self._schedule_repeat(key)
+
+    def _schedule_repeat(self, key: ButtonKey):
+        hold_repeat_ms = self.config(key).hold_repeat_ms
+        if hold_repeat_ms > 0:
+            self.get(key).repeat_timer = asyncio.get_running_loop().call_later(
+                hold_repeat_ms / 1000, self._on_repeat, key
+            )
+
+
+class KeyAuditLog:
+    """Append-only log of key changes, written in the background."""
+
+    def __init__(self, path: str) -> None:
+        """Init key audit log."""
+        self._path = path
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: any = None
+
+    def start(self):
+        """Start the background writer."""
+        self._task = asyncio.ensure_future(self._run())
+
+    def record(self, key: ButtonKey, uuid: str, pressed: bool):
+        """Queue a key change, never blocks."""
+        self._queue.put_nowait((time.time(), key, uuid, pressed))
+
+    @staticmethod
+    def _format(item: Tuple[float, ButtonKey, str, bool]) -> str:
+        timestamp, (device, key), uuid, pressed = item
+        line = json.dumps(
+            {
+                "time": datetime.fromtimestamp(timestamp).strftime(DATETIME_FORMAT),
+                "device": device,
+                "key": key,
+                "uuid": uuid,
+                "state": "down" if pressed else "up",
+            }
+        )
+        return line + "\n"
+
+    def _take_lines(self) -> List[str]:
+        lines = []
+        while not self._queue.empty():
+            lines.append(self._format(self._queue.get_nowait()))
+        return lines
+
+    def _append(self, lines: List[str]):
+        with open(self._path, "a", encoding="utf-8") as file:
+            file.writelines(lines)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            lines = [self._format(await self._queue.get())]
+            lines.extend(self._take_lines())
+            await loop.run_in_executor(None, self._append, lines)
+
+    def close(self):
+        """Stop the background writer and write what is left."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        lines = self._take_lines()
+        if len(lines) > 0:
+            self._append(lines)
@@ -0,0 +1,150 @@
+"""Stream Deck API metrics."""
+
+import bisect
+import threading
+from typing import Dict, List, Sequence, Union
+
+# Upper bounds in seconds, from a cached render to a stalled USB hub
+LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+METRICS_CONTENT_TYPE = "text/plain"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    """Format labels in the Prometheus text format, e.g. {deck="AL123"}."""
+    if len(labels) == 0:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+def format_metric(
+    name: str,
+    kind: str,
+    help_text: str,
+    samples: Union[float, Dict[str, float]],
+) -> List[str]:
+    """Format a counter or gauge in the Prometheus text format.
+
+    Args:
+        name (str): Metric name
+        kind (str): "counter" or "gauge"
+        help_text (str): Description of the metric
+        samples (float or Dict[str, float]): Value, or values by formatted labels
+    """
+    if not isinstance(samples, dict):
+        samples = {"": samples}
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    lines.extend(f"{name}{labels} {value}" for labels, value in samples.items())
+    return lines
+
+
+class Histogram:
+    """Latency histogram with fixed buckets.
+
+    Observing costs a binary search and two additions, so it can stay enabled.
+    Observations may come from any thread.
+    """
+
+    def __init__(
+        self, name: str, help_text: str, buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> None:
+        """Init histogram."""
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        # The last count is for values above all buckets
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        """Add an observation."""
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += seconds
+
+    def collect(self) -> List[str]:
+        """Format the histogram in the Prometheus text format."""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} histogram",
+        ]
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        cumulative += counts[-1]
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"{self.name}_sum {total}")
+        lines.append(f"{self.name}_count {cumulative}")
+        return lines
+
+
+class Metrics:
+    """Latency histograms of the hot paths of the server.
+
+    Counters and gauges are read from the components when the metrics are
+    collected, so they cost nothing in between.
+    """
+
+    def __init__(self) -> None:
+        """Init metrics."""
+        self.render = Histogram(
+            "streamdeckapi_render_seconds",
+            "Time to render an svg to a key image, cache misses only",
+        )
+        self.usb_write = Histogram(
+            "streamdeckapi_usb_write_seconds",
+            "Time to write a key image to a deck",
+        )
+        self.db_write = Histogram(
+            "streamdeckapi_db_write_seconds",
+            "Time to write a batch of buttons to the database",
+        )
+        self.broadcast = Histogram(
+            "streamdeckapi_broadcast_seconds",
+            "Time to queue an event or status update for the websocket clients",
+        )
+        self.key_event = Histogram(
+            "streamdeckapi_key_event_seconds",
+            "Time from a key change to its event being queued for the clients",
+        )
+
+    def collect(self) -> List[str]:
+        """Format all histograms in the Prometheus text format."""
+        lines = []
+        for histogram in (
+            self.render,
+            self.usb_write,
+            self.db_write,
+            self.broadcast,
+            self.key_event,
+        ):
+            lines.extend(histogram.collect())
+        return lines
@@ -0,0 +1,305 @@
+"""Stream Deck API button registry."""
+
+import asyncio
+import base64
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from streamdeckapi.const import DB_FLUSH_SECONDS
+from streamdeckapi.types import SDButton
+
+# Serial number of the device and index of the key on it
+ButtonKey = Tuple[str, int]
+
+SCHEMA_VERSION = 2
+
+
+def format_key(key: ButtonKey) -> str:
+    """Get the id of a button in the status."""
+    return f"{key[0]}:{key[1]}"
+
+
+class ButtonRegistry:
+    """In-memory button registry with write-behind persistence.
+
+    The registry is the authoritative source for all buttons, keyed by the
+    serial number of their device and their key. Reads never touch the
+    database, changes are queued and written in batches by `flush`.
+    """
+
+    def __init__(
+        self,
+        db_file: str,
+        flush_interval: float = DB_FLUSH_SECONDS,
+        on_change: Optional[Callable[[ButtonKey], None]] = None,
+        on_write: Optional[Callable[[float], None]] = None,
+    ):
+        """Init button registry.
+
+        Args:
+            db_file (str): Path to the SQLite database
+            flush_interval (float): Seconds between two writes to the database
+            on_change (Callable[[ButtonKey], None] or None): Called with the key of a saved button
+            on_write (Callable[[float], None] or None): Called with the seconds of each database write
+        """
+        self._db_file = db_file
+        self.flush_interval = flush_interval
+        self.on_change = on_change
+        self.on_write = on_write
+        self._buttons: Dict[ButtonKey, SDButton] = {}
+        self._keys: Dict[str, ButtonKey] = {}
+        self._pending: Dict[ButtonKey, SDButton] = {}
+        # Settings of a button that differ from the defaults, e.g. its gestures
+        self._configs: Dict[ButtonKey, dict] = {}
+        self._database: Optional[sqlite3.Connection] = None
+        # A single thread keeps the writes ordered and the connection private
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="streamdeckapi-db")
+
+    #
+    #   Properties
+    #
+
+    @property
+    def pending(self) -> int:
+        """Number of buttons waiting to be written."""
+        return len(self._pending)
+
+    #
+    #   Lookups
+    #
+
+    def get(self, key: ButtonKey) -> Optional[SDButton]:
+        """Get a button by its key."""
+        return self._buttons.get(key)
+
+    def get_by_uuid(self, uuid: str) -> Optional[SDButton]:
+        """Get a button by its uuid."""
+        key = self._keys.get(uuid)
+        if key is None:
+            return None
+        return self._buttons[key]
+
+    def get_key(self, uuid: str) -> Optional[ButtonKey]:
+        """Get the key of a button, None if unknown."""
+        return self._keys.get(uuid)
+
+    def all(self) -> Dict[ButtonKey, SDButton]:
+        """Get all buttons."""
+        return dict(self._buttons)
+
+    def device(self, serial: str) -> Dict[int, SDButton]:
+        """Get the buttons of a device by their key."""
+        return {
+            key: button
+            for (device, key), button in self._buttons.items()
+            if device == serial
+        }
+
+    def get_config(self, key: ButtonKey) -> dict:
+        """Get the settings of a button that differ from the defaults."""
+        return dict(self._configs.get(key, {}))
+
+    def configs(self) -> Dict[ButtonKey, dict]:
+        """Get the settings of all configured buttons."""
+        return {key: dict(config) for key, config in self._configs.items()}
+
+    #
+    #   Changes
+    #
+
+    def save(self, key: ButtonKey, button: SDButton):
+        """Save a button and queue it for persistence."""
+        old_button = self._buttons.get(key)
+        if old_button is not None and old_button.uuid != button.uuid:
+            self._keys.pop(old_button.uuid, None)
+        self._buttons[key] = button
+        self._keys[button.uuid] = key
+        self._pending[key] = button
+        if self.on_change is not None:
+            self.on_change(key)
+
+    def save_config(self, key: ButtonKey, config: dict):
+        """Save the settings of a button and queue them for persistence."""
+        self._configs[key] = dict(config)
+        button = self._buttons.get(key)
+        if button is not None:
+            self._pending[key] = button
+
+    #
+    #   Persistence
+    #
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._database is None:
+            self._database = sqlite3.connect(self._db_file, check_same_thread=False)
+        return self._database
+
+    def _migrate(self, database: sqlite3.Connection):
+        """Create or update the tables to the current schema."""
+        version = database.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        with database:
+            migrated = version > 0
+            if version < 1:
+                migrated = self._migrate_v1(database)
+            if version < 2:
+                # Version 2 keeps the settings of a button with it
+                database.execute("ALTER TABLE buttons ADD COLUMN config text")
+            database.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        if migrated:
+            print("Migrated buttons to schema version", SCHEMA_VERSION)
+
+    @staticmethod
+    def _migrate_v1(database: sqlite3.Connection) -> bool:
+        """Create the buttons table keyed by device and key.
+
+        Returns:
+            bool: Whether buttons of version 0 were migrated
+        """
+        legacy = database.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name='buttons'"
+        ).fetchone()
+        if legacy is not None:
+            # Version 0 keyed buttons by key only, all decks shared them
+            database.execute("ALTER TABLE buttons RENAME TO buttons_v0")
+        database.execute(
+            """
+                CREATE TABLE buttons(
+                   device text NOT NULL,
+                   key integer NOT NULL,
+                   uuid text NOT NULL UNIQUE,
+                   x integer,
+                   y integer,
+                   svg text,
+                   PRIMARY KEY (device, key)
+                );"""
+        )
+        if legacy is None:
+            return False
+        # Version 0 allowed a uuid on several keys. Without timestamps, the row
+        # with the highest rowid is kept, the other keys get new buttons.
+        database.execute(
+            """
+                INSERT INTO buttons
+                SELECT device,key,uuid,x,y,svg FROM buttons_v0
+                WHERE rowid IN (
+                    SELECT MAX(rowid) FROM buttons_v0
+                    WHERE device IS NOT NULL
+                    GROUP BY uuid
+                );"""
+        )
+        database.execute("DROP TABLE buttons_v0")
+        return True
+
+    def load(self) -> int:
+        """Create or migrate the tables and load all buttons from the database."""
+        database = self._connect()
+        self._migrate(database)
+
+        for row in database.execute(
+            "SELECT device,key,uuid,x,y,svg,config FROM buttons"
+        ):
+            button = SDButton(
+                {
+                    "uuid": row[2],
+                    "device": row[0],
+                    "position": {"x": row[3], "y": row[4]},
+                    "svg": base64.b64decode(row[5].encode()).decode(),
+                }
+            )
+            self._buttons[(row[0], row[1])] = button
+            self._keys[button.uuid] = (row[0], row[1])
+            if row[6] is not None:
+                self._configs[(row[0], row[1])] = json.loads(row[6])
+
+        print(f"Loaded {len(self._buttons)} buttons from DB")
+        return len(self._buttons)
+
+    def _take_pending(self) -> Dict[ButtonKey, SDButton]:
+        """Take and clear the queued buttons."""
+        pending = self._pending
+        self._pending = {}
+        return pending
+
+    def _requeue(self, buttons: Dict[ButtonKey, SDButton]):
+        """Queue buttons again after a failed write, newer changes win."""
+        for key, button in buttons.items():
+            self._pending.setdefault(key, button)
+
+    def _rows(self, buttons: Dict[ButtonKey, SDButton]) -> List[Tuple]:
+        """Serialize buttons and their settings to database rows."""
+        return [
+            (
+                device,
+                key,
+                button.uuid,
+                button.position.x_pos,
+                button.position.y_pos,
+                base64.b64encode(button.svg.encode()).decode(),
+                self._serialize_config((device, key)),
+            )
+            for (device, key), button in buttons.items()
+        ]
+
+    def _serialize_config(self, key: ButtonKey) -> Optional[str]:
+        config = self._configs.get(key)
+        if config is None:
+            return None
+        return json.dumps(config)
+
+    def _write(self, rows: List[Tuple]):
+        """Write rows to the database in a single transaction."""
+        started = time.perf_counter()
+        database = self._connect()
+        with database:
+            database.executemany(
+                "INSERT OR REPLACE INTO buttons VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+        if self.on_write is not None:
+            self.on_write(time.perf_counter() - started)
+
+    def flush(self) -> int:
+        """Write all queued buttons, blocking.
+
+        Buttons that couldn't be written stay queued.
+        """
+        buttons = self._take_pending()
+        if len(buttons) > 0:
+            try:
+                self._executor.submit(self._write, self._rows(buttons)).result()
+            except Exception:
+                self._requeue(buttons)
+                raise
+        return len(buttons)
+
+    async def flush_async(self) -> int:
+        """Write all queued buttons without blocking the event loop.
+
+        Buttons that couldn't be written stay queued for the next flush.
+        """
+        buttons = self._take_pending()
+        if len(buttons) > 0:
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self._write, self._rows(buttons)
+                )
+            except Exception:
+                self._requeue(buttons)
+                raise
+            print(f"Saved {len(buttons)} buttons to database")
+        return len(buttons)
+
+    def close(self):
+        """Flush the queue and close the database."""
+        try:
+            self.flush()
+        except sqlite3.Error as error:
+            print(f"Error saving {self.pending} buttons to database: {error}")
+        self._executor.shutdown()
+        if self._database is not None:
+            self._database.close()
+            self._database = None
@@ -0,0 +1,185 @@
+"""Stream Deck API icon rendering."""
+
+import asyncio
+import hashlib
+import io
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+from StreamDeck.Devices.StreamDeck import StreamDeck
+
+from streamdeckapi.const import (
+    RENDER_CACHE_BYTES,
+    RENDER_CACHE_ENTRIES,
+    RENDER_EXECUTOR,
+    RENDER_WORKERS,
+)
+
+
+class KeyImageTarget:
+    """Key image format of a deck, usable in place of the deck by PILHelper."""
+
+    def __init__(self, image_format: dict) -> None:
+        """Init key image target."""
+        self._image_format = image_format
+
+    def key_image_format(self) -> dict:
+        """Get the key image format."""
+        return self._image_format
+
+
+def render_svg(svg: str, image_format: dict) -> bytes:
+    """Render an svg to the native key image format.
+
+    cairo and PIL are imported on the first render, in the worker that renders.
+    """
+    # pylint: disable=import-outside-toplevel
+    import cairosvg
+    from PIL import Image
+    from StreamDeck.ImageHelpers import PILHelper
+
+    png_bytes = io.BytesIO()
+    cairosvg.svg2png(svg.encode("utf-8"), write_to=png_bytes)
+
+    target = KeyImageTarget(image_format)
+    icon = Image.open(png_bytes)
+    image = PILHelper.create_scaled_image(target, icon)
+
+    return bytes(PILHelper.to_native_format(target, image))
+
+
+def get_cache_key(deck: StreamDeck, svg: str) -> Tuple:
+    """Get the render cache key of an svg on a deck."""
+    image_format = deck.key_image_format()
+    return (
+        hashlib.sha1(svg.encode("utf-8")).digest(),
+        deck.deck_type(),
+        image_format["size"],
+        image_format["format"],
+        image_format["flip"],
+        image_format["rotation"],
+    )
+
+
+class RenderCache:
+    """LRU cache of rendered key images, bounded by entries and bytes."""
+
+    def __init__(
+        self,
+        max_entries: int = RENDER_CACHE_ENTRIES,
+        max_bytes: int = RENDER_CACHE_BYTES,
+    ) -> None:
+        """Init render cache."""
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._images: "OrderedDict[Tuple, bytes]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Tuple) -> Optional[bytes]:
+        """Get a rendered image."""
+        image = self._images.get(key)
+        if image is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._images.move_to_end(key)
+        return image
+
+    def put(self, key: Tuple, image: bytes):
+        """Add a rendered image, evicting the least recently used ones."""
+        if len(image) > self.max_bytes:
+            return
+        old_image = self._images.pop(key, None)
+        if old_image is not None:
+            self._bytes -= len(old_image)
+        self._images[key] = image
+        self._bytes += len(image)
+        while len(self._images) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._images.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """Get cache statistics."""
+        return {
+            "entries": len(self._images),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+def create_executor(
+    kind: str = RENDER_EXECUTOR, workers: int = RENDER_WORKERS
+) -> Executor:
+    """Create a render worker pool.
+
+    Args:
+        kind (str): "process" or "thread"
+        workers (int): Number of workers
+    """
+    if kind == "process":
+        return ProcessPoolExecutor(workers)
+    if kind == "thread":
+        return ThreadPoolExecutor(workers, thread_name_prefix="streamdeckapi-render")
+    raise ValueError(f"Unknown render executor {kind}")
+
+
+class Renderer:
+    """Render svgs in a worker pool, backed by a render cache.
+
+    Concurrent renders of the same image share one job.
+    """
+
+    def __init__(
+        self,
+        cache: RenderCache,
+        executor: Optional[Executor] = None,
+        on_render: Optional[Callable[[float], None]] = None,
+    ) -> None:
+        """Init renderer.
+
+        Args:
+            cache (RenderCache): Cache for rendered images
+            executor (Executor or None): Worker pool, the loop default if None
+            on_render (Callable[[float], None] or None): Called with the seconds of each render
+        """
+        self.cache = cache
+        self.executor = executor
+        self.on_render = on_render
+        self._jobs: Dict[Tuple, asyncio.Future] = {}
+
+    async def render(self, deck: StreamDeck, svg: str) -> bytes:
+        """Render an svg for a deck without blocking the event loop."""
+        cache_key = get_cache_key(deck, svg)
+        image = self.cache.get(cache_key)
+        if image is not None:
+            return image
+
+        job = self._jobs.get(cache_key)
+        if job is None:
+            started = time.perf_counter()
+            job = asyncio.get_running_loop().run_in_executor(
+                self.executor, render_svg, svg, deck.key_image_format()
+            )
+            self._jobs[cache_key] = job
+            job.add_done_callback(lambda done: self._on_done(cache_key, done, started))
+        return await asyncio.shield(job)
+
+    def _on_done(self, cache_key: Tuple, job: asyncio.Future, started: float):
+        self._jobs.pop(cache_key, None)
+        if not job.cancelled() and job.exception() is None:
+            self.cache.put(cache_key, job.result())
+            if self.on_render is not None:
+                self.on_render(time.perf_counter() - started)
+
+    def shutdown(self):
+        """Shut down the worker pool."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
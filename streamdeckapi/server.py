@@ -1,36 +1,60 @@
 """Stream Deck API Server."""
 
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import argparse
+import itertools
 import re
-import io
 import asyncio
 import platform
-import sqlite3
-import base64
+import signal
 import socket
-from datetime import datetime
-from typing import List, Dict
+import time
+from typing import Dict, List, Optional, Set
 import aiohttp
 import human_readable_ids as hri
-from jsonpickle import encode
 from aiohttp import web
-from StreamDeck.DeviceManager import DeviceManager
 from StreamDeck.Devices.StreamDeck import StreamDeck
-from StreamDeck.ImageHelpers import PILHelper
-import cairosvg
-from PIL import Image
-from zeroconf import ServiceInfo, Zeroconf
 
 from streamdeckapi.const import (
-    DATETIME_FORMAT,
     DB_FILE,
-    LONG_PRESS_SECONDS,
+    FAKE_DECK_MODELS,
+    MIN_FRAME_INTERVAL_MS,
+    NO_CONN_GRACE_SECONDS,
+    PLUGIN_CONFIG,
     PLUGIN_ICON,
+    PLUGIN_ICONS,
     PLUGIN_INFO,
+    PLUGIN_METRICS,
     PLUGIN_PORT,
+    PLUGIN_STATS,
+    RENDER_EXECUTOR,
+    RENDER_WORKERS,
     SD_ZEROCONF,
+    WS_COMMANDS,
+    WS_DROP_INTERVAL_SECONDS,
+    WS_HEARTBEAT_SECONDS,
+    WS_MAX_DROPS,
+    WS_QUEUE_SIZE,
 )
+from streamdeckapi.connections import (
+    EventBuffer,
+    Subscription,
+    Subscriptions,
+    WebsocketClient,
+)
+from streamdeckapi.keys import GestureConfig, GestureRecognizer, KeyAuditLog
+from streamdeckapi.metrics import (
+    METRICS_CONTENT_TYPE,
+    Metrics,
+    format_labels,
+    format_metric,
+)
+from streamdeckapi.registry import ButtonKey, ButtonRegistry, format_key
+from streamdeckapi.render import RenderCache, Renderer, create_executor
+from streamdeckapi.snapshot import StatusSnapshot
+from streamdeckapi.tools import json_dumps, json_loads
 from streamdeckapi.types import SDApplication, SDButton, SDButtonPosition, SDDevice
+from streamdeckapi.writer import PRIORITY_BULK, DeckWriter, IconUpdater
 
 
 DEFAULT_ICON = re.sub(
@@ -67,501 +91,946 @@ NO_CONN_ICON = re.sub(
 )
 
 
-application: SDApplication = SDApplication(
-    {
-        "font": "Segoe UI",
-        "language": "en",
-        "platform": platform.system(),
-        "platformVersion": platform.version(),
-        "version": "0.0.1",
-    }
-)
-devices: List[SDDevice] = []
-websocket_connections: List[web.WebSocketResponse] = []
-
-streamdecks: List[StreamDeck] = DeviceManager().enumerate()
-
-#
-#   Database
-#
+class StreamDeckServer:
+    """Stream Deck API server state: decks, buttons and websocket clients.
 
-database_first = sqlite3.connect(DB_FILE)
-table_cursor = database_first.cursor()
-table_cursor.execute(
+    Creating a server has no side effects. The database is loaded and the
+    decks are opened by `init_all`, the API is served by `start_server_async`.
     """
-                CREATE TABLE IF NOT EXISTS buttons(
-                   key integer PRIMARY KEY,
-                   uuid text NOT NULL,
-                   device text,
-                   x integer,
-                   y integer,
-                   svg text
-                );"""
-)
-table_cursor.execute(
-    """
-                CREATE TABLE IF NOT EXISTS button_states(
-                   key integer PRIMARY KEY,
-                   state integer,
-                   state_update text
-                );"""
-)
-table_cursor.execute("DELETE FROM button_states;")
-database_first.commit()
-table_cursor.close()
-database_first.close()
-
-
-def save_button(key: int, button: SDButton):
-    """Save button to database."""
-    database = sqlite3.connect(DB_FILE)
-    cursor = database.cursor()
-    svg_bytes = button.svg.encode()
-    base64_bytes = base64.b64encode(svg_bytes)
-    base64_string = base64_bytes.decode()
-
-    # Check if exists
-    result = cursor.execute(f"SELECT uuid FROM buttons WHERE key={key}")
-    matching_buttons = result.fetchall()
-    if len(matching_buttons) > 0:
-        # Perform update
-        cursor.execute(f'UPDATE buttons SET svg="{base64_string}" WHERE key={key}')
-    else:
-        # Create new row
-        cursor.execute(
-            f'INSERT INTO buttons VALUES ({key}, "{button.uuid}", "{button.device}", {button.position.x_pos}, {button.position.y_pos}, "{base64_string}")'
-        )
-    database.commit()
-    print(f"Saved button {button.uuid} with key {key} to database")
-    cursor.close()
-    database.close()
-
-
-def get_button(key: int) -> any:
-    """Get a button from the database."""
-    database = sqlite3.connect(DB_FILE)
-    cursor = database.cursor()
-    result = cursor.execute(
-        f"SELECT key,uuid,device,x,y,svg FROM buttons WHERE key={key}"
-    )
-    matching_buttons = result.fetchall()
-    if len(matching_buttons) == 0:
-        return None
-    row = matching_buttons[0]
-    base64_bytes = row[5].encode()
-    svg_bytes = base64.b64decode(base64_bytes)
-    svg_string = svg_bytes.decode()
-    button = SDButton(
-        {
-            "uuid": row[1],
-            "device": row[2],
-            "position": {"x": row[3], "y": row[4]},
-            "svg": svg_string,
-        }
-    )
-    cursor.close()
-    database.close()
-    return button
-
 
-def get_button_by_uuid(uuid: str) -> any:
-    """Get a button from the database."""
-    database = sqlite3.connect(DB_FILE)
-    cursor = database.cursor()
-    result = cursor.execute(
-        f'SELECT key,uuid,device,x,y,svg FROM buttons WHERE uuid="{uuid}"'
-    )
-    matching_buttons = result.fetchall()
-    if len(matching_buttons) == 0:
-        return None
-    row = matching_buttons[0]
-    base64_bytes = row[5].encode()
-    svg_bytes = base64.b64decode(base64_bytes)
-    svg_string = svg_bytes.decode()
-    button = SDButton(
-        {
-            "uuid": row[1],
-            "device": row[2],
-            "position": {"x": row[3], "y": row[4]},
-            "svg": svg_string,
-        }
-    )
-    cursor.close()
-    database.close()
-    return button
-
-
-def get_button_key(uuid: str) -> int:
-    """Get a button key from the database."""
-    database = sqlite3.connect(DB_FILE)
-    cursor = database.cursor()
-    result = cursor.execute(f'SELECT key FROM buttons WHERE uuid="{uuid}"')
-    matching_buttons = result.fetchall()
-    if len(matching_buttons) == 0:
-        return -1
-    row = matching_buttons[0]
-    key = row[0]
-    cursor.close()
-    database.close()
-    return key
-
-
-def get_buttons() -> Dict[str, SDButton]:
-    """Load all buttons from the database."""
-    result: Dict[str, SDButton] = {}
-    database = sqlite3.connect(DB_FILE)
-    cursor = database.cursor()
-    for row in cursor.execute("SELECT key,uuid,device,x,y,svg FROM buttons"):
-        base64_bytes = row[5].encode()
-        svg_bytes = base64.b64decode(base64_bytes)
-        svg_string = svg_bytes.decode()
-        result[row[0]] = SDButton(
+    def __init__(
+        self,
+        streamdecks: List[StreamDeck],
+        db_file: str = DB_FILE,
+        render_executor: Optional[Executor] = None,
+        min_frame_interval_ms: int = MIN_FRAME_INTERVAL_MS,
+        ws_queue_size: int = WS_QUEUE_SIZE,
+        ws_max_drops: int = WS_MAX_DROPS,
+    ) -> None:
+        """Init server.
+
+        Args:
+            streamdecks (List[StreamDeck]): Decks to serve, not opened yet
+            db_file (str): Path to the SQLite database
+            render_executor (Executor or None): Render worker pool, the loop default if None
+            min_frame_interval_ms (int): Default minimum time between two icons of a key
+            ws_queue_size (int): Messages queued per websocket client
+            ws_max_drops (int): Dropped messages before a websocket client is disconnected
+        """
+        self.application = SDApplication(
             {
-                "uuid": row[1],
-                "device": row[2],
-                "position": {"x": row[3], "y": row[4]},
-                "svg": svg_string,
+                "font": "Segoe UI",
+                "language": "en",
+                "platform": platform.system(),
+                "platformVersion": platform.version(),
+                "version": "0.0.1",
             }
         )
-    cursor.close()
-    database.close()
-    print(f"Loaded {len(result)} buttons from DB")
-    return result
-
-
-def write_button_state(key: int, state: bool, update: str):
-    """Write button state to database."""
-    state_int = 0
-    if state is True:
-        state_int = 1
-
-    database = sqlite3.connect(DB_FILE)
-    cursor = database.cursor()
-
-    # Check if exists
-    result = cursor.execute(f"SELECT state FROM button_states WHERE key={key}")
-    matching_states = result.fetchall()
-    if len(matching_states) > 0:
-        # Perform update
-        cursor.execute(
-            f'UPDATE button_states SET state={state_int}, state_update="{update}" WHERE key={key}'
+        self.devices: List[SDDevice] = []
+        self.websocket_connections: List[WebsocketClient] = []
+        self.events = EventBuffer()
+        self.subscriptions = Subscriptions()
+        self.ws_queue_size = ws_queue_size
+        self.ws_max_drops = ws_max_drops
+        # Drops of disconnected clients, the connected ones count their own
+        self.ws_drops_closed = 0
+        # Running websocket commands, referenced until they are done
+        self.command_tasks: Set[asyncio.Task] = set()
+        self.metrics = Metrics()
+
+        self.streamdecks = streamdecks
+        self.writers: Dict[str, DeckWriter] = {}
+        # Serial numbers by deck id and decks by serial number, reading the serial is slow
+        self.serials: Dict[str, str] = {}
+        self.decks: Dict[str, StreamDeck] = {}
+
+        self.registry = ButtonRegistry(db_file, on_write=self.metrics.db_write.observe)
+        self.snapshot = StatusSnapshot(self.application, self.devices, self.registry)
+        self.registry.on_change = self.snapshot.touch
+
+        self.audit_log: Optional[KeyAuditLog] = None
+
+        self.render_cache = RenderCache()
+        self.renderer = Renderer(
+            self.render_cache, render_executor, self.metrics.render.observe
         )
-    else:
-        # Create new row
-        cursor.execute(
-            f'INSERT INTO button_states VALUES ({key}, {state_int}, "{update}")'
+        self.icons = IconUpdater(self.renderer, self.get_writer, min_frame_interval_ms)
+        # Latest icon update by uuid, renders may finish in any order
+        self._icon_order = itertools.count()
+        self._latest_icons: Dict[str, int] = {}
+        self.gestures = GestureRecognizer(self.on_gesture)
+        self.no_connection = NoConnectionScreen(self)
+
+    #
+    #   API
+    #
+
+    async def api_info_handler(self, request: web.Request):
+        """Handle info requests."""
+        headers = {"ETag": self.snapshot.etag}
+        if self.snapshot.matches(request.headers.get("If-None-Match")):
+            return web.Response(status=304, headers=headers)
+        return web.Response(
+            body=self.snapshot.body(), content_type="application/json", headers=headers
         )
-    database.commit()
-    print(f"Saved button_state with key {key} to database")
-    cursor.close()
-    database.close()
-
-
-def get_button_state(key: int) -> any:
-    """Load button_state from database."""
-    result = ()
-    database = sqlite3.connect(DB_FILE)
-    cursor = database.cursor()
-    result = cursor.execute(
-        f"SELECT key,state,state_update FROM button_states WHERE key={key}"
-    )
-    matching_states = result.fetchall()
-    if len(matching_states) == 0:
-        return None
-    row = matching_states[0]
-    state = False
-    if row[1] == 1:
-        state = True
-    result = (state, row[2])
-    cursor.close()
-    database.close()
-    return result
-
-
-#
-#   API
-#
-
-
-async def api_info_handler(_: web.Request):
-    """Handle info requests."""
-    json_data = encode(
-        {"devices": devices, "application": application, "buttons": get_buttons()},
-        unpicklable=False,
-    )
-    if not isinstance(json_data, str):
-        return web.Response(status=500, text="jsonpickle error")
-    json_data = (
-        json_data.replace('"x_pos"', '"x"')
-        .replace('"y_pos"', '"y"')
-        .replace('"platform_version"', '"platformVersion"')
-    )
-    return web.Response(text=json_data, content_type="application/json")
-
-
-async def api_icon_get_handler(request: web.Request):
-    """Handle icon get requests."""
-    uuid = request.match_info["uuid"]
-    button = get_button_by_uuid(uuid)
-    if not isinstance(button, SDButton):
-        return web.Response(status=404, text="Button not found")
-    return web.Response(text=button.svg, content_type="image/svg+xml")
 
+    async def api_icon_get_handler(self, request: web.Request):
+        """Handle icon get requests."""
+        uuid = request.match_info["uuid"]
+        button = self.registry.get_by_uuid(uuid)
+        if not isinstance(button, SDButton):
+            return web.Response(status=404, text="Button not found")
+        headers = {"ETag": self.snapshot.button_etag(self.registry.get_key(uuid))}
+        if self.snapshot.matches(request.headers.get("If-None-Match"), headers["ETag"]):
+            return web.Response(status=304, headers=headers)
+        return web.Response(
+            text=button.svg, content_type="image/svg+xml", headers=headers
+        )
 
-async def api_icon_set_handler(request: web.Request):
-    """Handle icon set requests."""
-    uuid = request.match_info["uuid"]
-    if not request.has_body:
-        return web.Response(status=422, text="No data in request")
-    body = await request.text()
-    if not body.startswith("<svg"):
-        return web.Response(status=422, text="Only svgs are supported")
-    button = get_button_by_uuid(uuid)
-    if not isinstance(button, SDButton):
-        return web.Response(status=404, text="Button not found")
+    async def api_icon_set_handler(self, request: web.Request):
+        """Handle icon set requests."""
+        uuid = request.match_info["uuid"]
+        if not request.has_body:
+            return web.Response(status=422, text="No data in request")
+        body = await request.text()
+
+        # Update icon
+        try:
+            changed = await self.set_icon(uuid, body)
+        except ValueError as error:
+            return web.Response(status=422, text=str(error))
+        except LookupError as error:
+            return web.Response(status=404, text=str(error))
+        if not changed:
+            return web.Response(
+                text="Icon unchanged", headers={"X-Icon-Unchanged": "1"}
+            )
 
-    # Update icon
-    update_button_icon(uuid, body)
+        print("Icon for button", uuid, "changed")
 
-    print("Icon for button", uuid, "changed")
+        return web.Response(text="Icon changed")
 
-    return web.Response(text="Icon changed")
+    async def api_icons_set_handler(self, request: web.Request):
+        """Handle batch icon set requests."""
+        try:
+            body = await request.json()
+        except ValueError:
+            return web.Response(status=422, text="Invalid JSON")
+        if not isinstance(body, dict):
+            return web.Response(
+                status=422, text="Icons have to be a map of uuid to svg"
+            )
 
+        results = await self.set_icons(body)
+        print(f"Icons for {len(body)} buttons set")
+
+        return web.json_response({"results": results})
+
+    async def api_config_get_handler(self, request: web.Request):
+        """Handle button config get requests."""
+        uuid = request.match_info["uuid"]
+        key = self.registry.get_key(uuid)
+        if key is None:
+            return web.Response(status=404, text="Button not found")
+        return web.json_response(self.get_button_config(key))
+
+    async def api_config_set_handler(self, request: web.Request):
+        """Handle button config set requests."""
+        uuid = request.match_info["uuid"]
+        key = self.registry.get_key(uuid)
+        if key is None:
+            return web.Response(status=404, text="Button not found")
+        try:
+            body = await request.json()
+            config = {**self.registry.get_config(key), **body}
+            self.configure_button(key, config)
+        except (ValueError, TypeError) as error:
+            return web.Response(status=422, text=f"Invalid config: {error}")
+        self.registry.save_config(key, config)
+        return web.json_response(self.get_button_config(key))
+
+    async def api_stats_handler(self, _: web.Request):
+        """Handle stats requests."""
+        return web.json_response(
+            {
+                "renderCache": self.render_cache.stats(),
+                "iconUpdates": {
+                    "submitted": self.icons.submitted,
+                    "dropped": self.icons.dropped,
+                    "unchanged": self.icons.unchanged,
+                    "skippedWrites": sum(
+                        writer.skipped for writer in self.writers.values()
+                    ),
+                },
+                "websockets": {
+                    "clients": len(self.websocket_connections),
+                    "queued": sum(
+                        client.depth for client in self.websocket_connections
+                    ),
+                    "drops": sum(client.drops for client in self.websocket_connections),
+                },
+            }
+        )
 
-async def websocket_handler(request: web.Request):
-    """Handle websocket."""
-    web_socket = web.WebSocketResponse()
-    await web_socket.prepare(request)
+    async def api_metrics_handler(self, _: web.Request):
+        """Handle metrics requests, in the Prometheus text format."""
+        deck_labels = {
+            deck_id: format_labels({"deck": self.serials.get(deck_id, deck_id)})
+            for deck_id in self.writers
+        }
+        lines = self.metrics.collect()
+        for name, kind, help_text, samples in (
+            (
+                "streamdeckapi_icon_updates_total",
+                "counter",
+                "Icons submitted to be shown",
+                self.icons.submitted,
+            ),
+            (
+                "streamdeckapi_icon_updates_dropped_total",
+                "counter",
+                "Icons replaced before they were shown",
+                self.icons.dropped,
+            ),
+            (
+                "streamdeckapi_icon_updates_unchanged_total",
+                "counter",
+                "Icons set to what the button already showed",
+                self.icons.unchanged,
+            ),
+            (
+                "streamdeckapi_usb_writes_skipped_total",
+                "counter",
+                "Key images not written because the key already showed them",
+                {
+                    deck_labels[deck_id]: writer.skipped
+                    for deck_id, writer in self.writers.items()
+                },
+            ),
+            (
+                "streamdeckapi_render_cache_hits_total",
+                "counter",
+                "Renders answered from the render cache",
+                self.render_cache.hits,
+            ),
+            (
+                "streamdeckapi_render_cache_misses_total",
+                "counter",
+                "Renders not in the render cache",
+                self.render_cache.misses,
+            ),
+            (
+                "streamdeckapi_render_cache_evictions_total",
+                "counter",
+                "Images evicted from the render cache",
+                self.render_cache.evictions,
+            ),
+            (
+                "streamdeckapi_render_cache_bytes",
+                "gauge",
+                "Size of the images in the render cache",
+                self.render_cache.stats()["bytes"],
+            ),
+            (
+                "streamdeckapi_key_events_total",
+                "counter",
+                "Key events and gestures sent to the websocket clients",
+                self.events.seq,
+            ),
+            (
+                "streamdeckapi_websocket_dropped_messages_total",
+                "counter",
+                "Status messages dropped for slow websocket clients",
+                self.ws_drops_closed
+                + sum(client.drops for client in self.websocket_connections),
+            ),
+            (
+                "streamdeckapi_websocket_clients",
+                "gauge",
+                "Connected websocket clients",
+                len(self.websocket_connections),
+            ),
+            (
+                "streamdeckapi_websocket_queue_depth",
+                "gauge",
+                "Messages queued for all websocket clients",
+                sum(client.depth for client in self.websocket_connections),
+            ),
+            (
+                "streamdeckapi_usb_queue_depth",
+                "gauge",
+                "Key images queued to be written to a deck",
+                {
+                    deck_labels[deck_id]: writer.depth
+                    for deck_id, writer in self.writers.items()
+                },
+            ),
+            (
+                "streamdeckapi_db_pending_buttons",
+                "gauge",
+                "Buttons waiting to be written to the database",
+                self.registry.pending,
+            ),
+        ):
+            lines.extend(format_metric(name, kind, help_text, samples))
+        return web.Response(
+            text="\n".join(lines) + "\n",
+            content_type=METRICS_CONTENT_TYPE,
+            charset="utf-8",
+        )
 
-    await web_socket.send_str(encode({"event": "connected", "args": {}}))
+    async def websocket_handler(self, request: web.Request):
+        """Handle websocket."""
+        web_socket = web.WebSocketResponse(heartbeat=WS_HEARTBEAT_SECONDS)
+        await web_socket.prepare(request)
+
+        since = get_query_int(request, "since")
+        version = get_query_int(request, "version")
+        try:
+            subscription = Subscription(request.query)
+        except ValueError:
+            subscription = Subscription()
+        resumed = (
+            since is not None
+            and request.query.get("epoch") == self.snapshot.epoch
+            and self.events.since(since) is not None
+        )
+        await web_socket.send_str(
+            json_dumps(
+                {
+                    "event": "connected",
+                    "args": {
+                        "epoch": self.snapshot.epoch,
+                        "seq": self.events.seq,
+                        "resumed": resumed,
+                        "commands": list(WS_COMMANDS),
+                    },
+                }
+            )
+        )
+        if resumed:
+            # Replay until caught up, events of the meantime are in the buffer too
+            while since < self.events.seq:
+                replay = self.events.since(since, subscription)
+                if replay is None:
+                    break
+                since = self.events.seq
+                try:
+                    for message in replay:
+                        await web_socket.send_str(message)
+                except ConnectionError:
+                    return web_socket
+
+        client = WebsocketClient(web_socket, self.ws_queue_size, self.ws_max_drops)
+        client.start()
+        try:
+            self.subscriptions.add(client, subscription)
+            keys = self.get_subscribed_keys(subscription)
+            if (
+                resumed
+                and version is not None
+                and 0 <= version <= self.snapshot.version
+            ):
+                client.acked_version = version
+                if version < self.snapshot.version:
+                    client.send(self.snapshot.delta_message(version, keys))
+            else:
+                client.send(self.snapshot.message(keys))
+                client.sent_version = self.snapshot.version
+
+            self.websocket_connections.append(client)
+            self.no_connection.on_clients_changed(len(self.websocket_connections))
+
+            async for msg in web_socket:
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    if msg.data == "close":
+                        await web_socket.close()
+                    else:
+                        self.handle_client_message(client, msg.data)
+                elif msg.type == aiohttp.WSMsgType.ERROR:
+                    print(
+                        "Websocket connection closed with exception "
+                        f"{web_socket.exception()}"
+                    )
+        finally:
+            # Also when the handler is cancelled or fails
+            client.stop()
+            self.ws_drops_closed += client.drops
+            self.subscriptions.remove(client)
+            if client in self.websocket_connections:
+                self.websocket_connections.remove(client)
+                self.no_connection.on_clients_changed(len(self.websocket_connections))
+        return web_socket
+
+    def handle_client_message(self, client: WebsocketClient, data: str):
+        """Handle a message sent by a websocket client."""
+        try:
+            message = json_loads(data)
+            event = message["event"]
+            args = message.get("args", {})
+        except (ValueError, KeyError, TypeError, AttributeError):
+            print("Invalid websocket message")
+            return
+
+        if event == "statusAck":
+            try:
+                client.acked_version = int(args["version"])
+            except (KeyError, TypeError, ValueError):
+                print("Invalid statusAck message")
+        elif event == "getStatus":
+            keys = self.get_subscribed_keys(self.subscriptions.get(client))
+            client.send(self.snapshot.message(keys))
+            client.sent_version = self.snapshot.version
+        elif event in WS_COMMANDS:
+            task = asyncio.ensure_future(
+                self.respond(client, message.get("id"), event, args)
+            )
+            self.command_tasks.add(task)
+            task.add_done_callback(self.command_tasks.discard)
+        elif event in ("subscribe", "unsubscribe"):
+            try:
+                subscription = Subscription(args if event == "subscribe" else None)
+            except (ValueError, AttributeError) as error:
+                print(f"Invalid subscribe message: {error}")
+                return
+            self.subscriptions.add(client, subscription)
+            # Buttons not known to the client yet may be subscribed now
+            client.acked_version = None
+            client.send(self.snapshot.message(self.get_subscribed_keys(subscription)))
+            client.sent_version = self.snapshot.version
+        else:
+            print(f"Unknown websocket event {event}")
+
+    async def respond(
+        self, client: WebsocketClient, request_id: any, event: str, args: any
+    ):
+        """Run a command sent by a websocket client and send the response.
+
+        The client always gets a response, also if the command fails unexpectedly.
+        """
+        try:
+            response = await self.run_command(event, args)
+        except Exception as error:  # pylint: disable=broad-except
+            print(f"Error running websocket command {event}: {error}")
+            response = {"ok": False, "error": str(error)}
+        client.send(
+            json_dumps({"event": "response", "id": request_id, "args": response})
+        )
 
-    websocket_connections.append(web_socket)
+    async def run_command(self, event: str, args: any) -> dict:
+        """Run a command sent by a websocket client.
+
+        Returns:
+            dict: Arguments of the response, "ok" tells if the command succeeded
+        """
+        try:
+            if event == "setIcon":
+                changed = await self.set_icon(args["uuid"], args["svg"])
+                return {"ok": True, "changed": changed}
+            if event == "setIcons":
+                if not isinstance(args["icons"], dict):
+                    raise TypeError()
+                return {"ok": True, "results": await self.set_icons(args["icons"])}
+            if event == "getIcon":
+                button = self.registry.get_by_uuid(args["uuid"])
+                if not isinstance(button, SDButton):
+                    raise LookupError("Button not found")
+                return {"ok": True, "svg": button.svg}
+        except (KeyError, TypeError, AttributeError):
+            return {"ok": False, "error": "Invalid arguments"}
+        except (ValueError, LookupError) as error:
+            return {"ok": False, "error": str(error)}
+        return {"ok": False, "error": f"Unknown command {event}"}
+
+    def broadcast_event(self, event: str, button: SDButton):
+        """Number an event of a button and queue it for the subscribed clients."""
+        started = time.perf_counter()
+        message = self.events.add(event, button.uuid, button.device)
+        for client in self.subscriptions.clients(button.uuid, button.device, event):
+            client.send(message)
+        self.metrics.broadcast.observe(time.perf_counter() - started)
+
+    def get_subscribed_keys(
+        self, subscription: Subscription
+    ) -> Optional[Set[ButtonKey]]:
+        """Get the keys of the subscribed buttons, None if all are subscribed."""
+        if not subscription.filters_buttons:
+            return None
+        return {
+            key
+            for key, button in self.registry.all().items()
+            if subscription.matches_button(button.uuid, button.device)
+        }
 
-    async for msg in web_socket:
-        if msg.type == aiohttp.WSMsgType.TEXT:
-            print(msg.data)
-            if msg.data == "close":
-                await web_socket.close()
-        elif msg.type == aiohttp.WSMsgType.ERROR:
+    async def broadcast_status(self):
+        """Send each websocket client what changed since its last acknowledged status.
+
+        Clients that never acknowledged a status get the full status on changes.
+        Without changes, a small heartbeat is sent. Each message is built once
+        and shared by all clients with the same version and subscribed buttons.
+        """
+        started = time.perf_counter()
+        # Messages by known version, None for the full status, and subscribed buttons
+        messages: Dict[tuple, Optional[str]] = {}
+
+        def get_message(client: WebsocketClient, since: Optional[int]):
+            subscription = self.subscriptions.get(client)
+            buttons = None
+            if subscription.filters_buttons:
+                buttons = (subscription.devices, subscription.buttons)
+            if (since, buttons) not in messages:
+                keys = self.get_subscribed_keys(subscription)
+                if since is None:
+                    messages[(since, buttons)] = self.snapshot.message(keys)
+                else:
+                    messages[(since, buttons)] = self.snapshot.delta_message(
+                        since, keys
+                    )
+            return messages[(since, buttons)]
+
+        heartbeat = None
+        for client in self.websocket_connections:
+            message = None
+            if client.acked_version is None:
+                if client.sent_version != self.snapshot.version:
+                    message = get_message(client, None)
+                    client.sent_version = self.snapshot.version
+            elif client.acked_version < self.snapshot.version:
+                message = get_message(client, client.acked_version)
+            if message is None:
+                if heartbeat is None:
+                    heartbeat = self.snapshot.heartbeat_message()
+                message = heartbeat
+            client.send(message, droppable=True)
+        self.metrics.broadcast.observe(time.perf_counter() - started)
+
+    async def report_ws_drops(self):
+        """Log the messages dropped for slow websocket clients in the last interval."""
+        drops = [client.take_interval_drops() for client in self.websocket_connections]
+        if sum(drops) > 0:
+            slow = len([count for count in drops if count > 0])
             print(
-                f"Websocket connection closed with exception {web_socket.exception()}"
+                f"Dropped {sum(drops)} status messages for {slow} slow websocket "
+                f"client(s) in the last {WS_DROP_INTERVAL_SECONDS} s"
             )
 
-    websocket_connections.remove(web_socket)
-    return web_socket
-
-
-async def websocket_broadcast(message: str):
-    """Send a message to each websocket client."""
-    print(f"Broadcast to {len(websocket_connections)} clients")
-    for connection in websocket_connections:
-        await connection.send_str(message)
-
-
-async def broadcast_status():
-    """Broadcast the current status of the streamdeck."""
-
-    # Collect data
-    data = {
-        "event": "status",
-        "args": {
-            "devices": devices,
-            "application": application,
-            "buttons": get_buttons(),
-        },
-    }
-
-    data_str = encode(data, unpicklable=False)
-    data_str = (
-        data_str.replace('"x_pos"', '"x"')
-        .replace('"y_pos"', '"y"')
-        .replace('"platform_version"', '"platformVersion"')
-    )
-
-    # Broadcast
-    await websocket_broadcast(data_str)
-
-
-#
-#   Functions
-#
+    #
+    #   Functions
+    #
+
+    def create_runner(self):
+        """Create background runner"""
+        app = web.Application()
+        app.add_routes(
+            [
+                web.get("/", self.websocket_handler),
+                web.get(PLUGIN_INFO, self.api_info_handler),
+                web.get(PLUGIN_ICON + "/{uuid}", self.api_icon_get_handler),
+                web.post(PLUGIN_ICON + "/{uuid}", self.api_icon_set_handler),
+                web.post(PLUGIN_ICONS, self.api_icons_set_handler),
+                web.get(PLUGIN_CONFIG + "/{uuid}", self.api_config_get_handler),
+                web.post(PLUGIN_CONFIG + "/{uuid}", self.api_config_set_handler),
+                web.get(PLUGIN_STATS, self.api_stats_handler),
+                web.get(PLUGIN_METRICS, self.api_metrics_handler),
+            ]
+        )
+        return web.AppRunner(app)
+
+    async def start_server_async(self, host: str = "0.0.0.0", port: int = PLUGIN_PORT):
+        """Start API server."""
+        runner = self.create_runner()
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        print("Started Stream Deck API server on port", port)
+
+        Timer(10, self.broadcast_status)
+        Timer(WS_DROP_INTERVAL_SECONDS, self.report_ws_drops)
+        self.no_connection.on_clients_changed(len(self.websocket_connections))
+        Timer(self.registry.flush_interval, self.registry.flush_async)
+
+    def on_gesture(self, key: ButtonKey, event: str):
+        """Handle gestures detected by the recognizer."""
+        button = self.registry.get(key)
+        if not isinstance(button, SDButton):
+            return
+        print(f"Gesture {event} detected")
+        self.broadcast_event(event, button)
+
+    async def on_key_change(self, deck: StreamDeck, index: int, state: bool):
+        """Handle key change callbacks."""
+        started = time.perf_counter()
+        key = (self.serials[deck.id()], index)
+        button = self.registry.get(key)
+        if not isinstance(button, SDButton):
+            return
+
+        if self.audit_log is not None:
+            self.audit_log.record(key, button.uuid, state)
+
+        # Gestures may be detected right away, they follow the key event
+        if state is True:
+            self.broadcast_event("keyDown", button)
+            self.gestures.key_down(key)
+        else:
+            self.broadcast_event("keyUp", button)
+            self.gestures.key_up(key)
+        self.metrics.key_event.observe(time.perf_counter() - started)
+
+    def get_button_config(self, key: ButtonKey) -> dict:
+        """Get the config of a button."""
+        return {
+            **self.gestures.config(key).to_dict(),
+            "minFrameIntervalMs": self.icons.min_frame_interval(key),
+        }
 
+    def configure_button(self, key: ButtonKey, config: dict):
+        """Apply the settings of a button over the defaults.
 
-def create_runner():
-    """Create background runner"""
-    app = web.Application()
-    app.add_routes(
-        [
-            web.get("/", websocket_handler),
-            web.get(PLUGIN_INFO, api_info_handler),
-            web.get(PLUGIN_ICON + "/{uuid}", api_icon_get_handler),
-            web.post(PLUGIN_ICON + "/{uuid}", api_icon_set_handler),
+        Raises:
+            ValueError: If a setting is invalid
+        """
+        gesture_config = GestureConfig(config)
+        self.icons.set_min_frame_interval(
+            key, config.get("minFrameIntervalMs", self.icons.min_frame_interval_ms)
+        )
+        self.gestures.configure(key, gesture_config)
+
+    def validate_icon(self, uuid: str, svg: any):
+        """Validate a button icon.
+
+        Raises:
+            ValueError: If the icon is no svg
+            LookupError: If the button doesn't exist
+        """
+        if not isinstance(svg, str) or not svg.startswith("<svg"):
+            raise ValueError("Only svgs are supported")
+        if not isinstance(self.registry.get_by_uuid(uuid), SDButton):
+            raise LookupError("Button not found")
+
+    async def render_icon(self, uuid: str, svg: str):
+        """Render the icon of a button for its deck, filling the render cache.
+
+        Buttons of decks that aren't connected are rendered for any deck.
+
+        Raises:
+            ValueError: If the svg can't be rendered
+        """
+        deck = self.decks.get(self.registry.get_key(uuid)[0])
+        if deck is None:
+            deck = next(iter(self.decks.values()), None)
+        if deck is None:
+            return
+        try:
+            await self.renderer.render(deck, svg)
+        except Exception as error:  # pylint: disable=broad-except
+            raise ValueError(f"Invalid svg: {error}") from error
+
+    async def set_icon(self, uuid: str, svg: any) -> bool:
+        """Validate, render and set a button icon.
+
+        The icon is only saved if it renders.
+
+        Returns:
+            False if the button already has this icon or a newer icon was set
+            while rendering
+
+        Raises:
+            ValueError: If the icon is no svg or can't be rendered
+            LookupError: If the button doesn't exist
+        """
+        self.validate_icon(uuid, svg)
+        order = self.start_icon_update(uuid)
+        if self.registry.get_by_uuid(uuid).svg != svg:
+            await self.render_icon(uuid, svg)
+        if not self.is_latest_icon_update(uuid, order):
+            return False
+        return self.update_button_icon(uuid, svg)
+
+    async def set_icons(self, new_icons: Dict[str, any]) -> Dict[str, str]:
+        """Validate and set the icons of multiple buttons.
+
+        The changed icons are rendered in parallel for the deck of their button
+        first, then written in key order and saved in a single transaction. If
+        saving fails, the next periodic flush retries it. Icons that fail to render
+        or are set again while rendering aren't saved.
+
+        Returns:
+            Dict[str, str]: "changed", "unchanged" or the error for each uuid
+        """
+        results = {}
+        valid_icons = {}
+        for uuid, svg in new_icons.items():
+            try:
+                self.validate_icon(uuid, svg)
+                valid_icons[uuid] = svg
+            except (ValueError, LookupError) as error:
+                results[uuid] = str(error)
+        orders = {uuid: self.start_icon_update(uuid) for uuid in valid_icons}
+
+        # Also fills the render cache, so the writes below don't wait for each other
+        changed_uuids = [
+            uuid
+            for uuid, svg in valid_icons.items()
+            if self.registry.get_by_uuid(uuid).svg != svg
         ]
-    )
-    return web.AppRunner(app)
-
-
-async def check_websocket():
-    """Check if a websocket client is connected."""
-    if len(websocket_connections) == 0:
-        print("No connection")
-        for deck in streamdecks:
-            if not deck.is_visual():
-                continue
-
+        renders = await asyncio.gather(
+            *(self.render_icon(uuid, valid_icons[uuid]) for uuid in changed_uuids),
+            return_exceptions=True,
+        )
+        for uuid, error in zip(changed_uuids, renders):
+            if isinstance(error, Exception):
+                results[uuid] = str(error)
+                del valid_icons[uuid]
+
+        for uuid in sorted(valid_icons, key=self.registry.get_key):
+            changed = False
+            if self.is_latest_icon_update(uuid, orders[uuid]):
+                changed = self.update_button_icon(uuid, valid_icons[uuid])
+            results[uuid] = "changed" if changed else "unchanged"
+        try:
+            await self.registry.flush_async()
+        except Exception as error:  # pylint: disable=broad-except
+            # The icons are shown and stay queued for the next flush
+            print(f"Error saving icons: {error}")
+
+        return {uuid: results[uuid] for uuid in new_icons}
+
+    def start_icon_update(self, uuid: str) -> int:
+        """Number an icon update of a button, before awaiting its render."""
+        self._latest_icons[uuid] = next(self._icon_order)
+        return self._latest_icons[uuid]
+
+    def is_latest_icon_update(self, uuid: str, order: int) -> bool:
+        """Check that no icon update of the button started after this one."""
+        return self._latest_icons.get(uuid) == order
+
+    def update_button_icon(self, uuid: str, svg: str) -> bool:
+        """Update a button icon.
+
+        Returns:
+            False if the button already has this icon
+        """
+        button = self.registry.get_by_uuid(uuid)
+        button_key = self.registry.get_key(uuid)
+        if not isinstance(button, SDButton) or button_key is None:
+            return False
+        if button.svg == svg:
+            self.icons.unchanged += 1
+            return False
+
+        deck = self.decks.get(button_key[0])
+        if deck is not None and not self.no_connection.shown:
             if not deck.is_open():
                 deck.open()
 
-            for key in range(deck.key_count()):
-                set_icon(deck, key, NO_CONN_ICON)
-
-
-async def start_server_async(host: str = "0.0.0.0", port: int = PLUGIN_PORT):
-    """Start API server."""
-    runner = create_runner()
-    await runner.setup()
-    site = web.TCPSite(runner, host, port)
-    await site.start()
-    print("Started Stream Deck API server on port", PLUGIN_PORT)
-
-    Timer(10, broadcast_status)
-    Timer(3, check_websocket)
-
-
-def get_position(deck: StreamDeck, key: int) -> SDButtonPosition:
-    """Get the position of a key."""
-    return SDButtonPosition({"x": int(key / deck.KEY_COLS), "y": key % deck.KEY_COLS})
-
-
-async def long_press_callback(key: int):
-    """Handle callback after long press seconds."""
-
-    button = get_button(key)
-
-    now = datetime.now()
-
-    # Check state of button
-    db_button_state = get_button_state(key)
+            self.icons.submit(deck, button_key, svg)
 
-    if not isinstance(db_button_state, tuple):
-        print("ERROR reading state")
-        return
+        button.svg = svg
+        self.registry.save(button_key, button)
+        return True
 
-    last_update: str = db_button_state[1]
-    last_update_datetime = datetime.strptime(last_update, DATETIME_FORMAT)
-    diff = now - last_update_datetime
-
-    if db_button_state[0] is True and diff.seconds >= LONG_PRESS_SECONDS:
-        print("Long press detected")
-        await websocket_broadcast(encode({"event": "longPress", "args": button.uuid}))
-
-
-async def on_key_change(_: StreamDeck, key: int, state: bool):
-    """Handle key change callbacks."""
-    button = get_button(key)
-    if not isinstance(button, SDButton):
-        return
+    def get_writer(self, deck: StreamDeck) -> DeckWriter:
+        """Get the writer of a deck, starting it if needed."""
+        writer = self.writers.get(deck.id())
+        if writer is None:
+            writer = self.writers[deck.id()] = DeckWriter(
+                deck, self.metrics.usb_write.observe
+            )
+            writer.start()
+        return writer
+
+    async def paint_buttons(self, deck: StreamDeck):
+        """Draw the icons of the buttons of a deck, rendered in parallel.
+
+        Keys whose icon can't be rendered show the default icon instead.
+        """
+        buttons = self.registry.device(self.serials[deck.id()])
+        images = await asyncio.gather(
+            *(self.renderer.render(deck, button.svg) for button in buttons.values()),
+            return_exceptions=True,
+        )
+        if self.no_connection.shown:
+            # The last client left while rendering, the alert stays
+            return
+        writer = self.get_writer(deck)
+        for (key, button), image in zip(buttons.items(), images):
+            if isinstance(image, Exception):
+                print(f"Error rendering icon of button {button.uuid}: {image}")
+                try:
+                    image = await self.renderer.render(deck, DEFAULT_ICON)
+                except Exception:  # pylint: disable=broad-except
+                    continue
+            writer.submit(key, image, PRIORITY_BULK)
+
+    def new_uuid(self) -> str:
+        """Get a uuid no button has yet."""
+        while True:
+            uuid = hri.get_new_id().lower().replace(" ", "-")
+            if self.registry.get_by_uuid(uuid) is None:
+                return uuid
+
+    async def init_deck(self, deck: StreamDeck, executor: Executor) -> SDDevice:
+        """Init a Stream Deck device, the blocking parts in the executor."""
+        serial = await asyncio.get_running_loop().run_in_executor(
+            executor, open_deck, deck
+        )
+        self.serials[deck.id()] = serial
+        self.decks[serial] = deck
 
-    if state is True:
-        await websocket_broadcast(encode({"event": "keyDown", "args": button.uuid}))
-        print("Waiting for button release")
-        # Start timer
-        Timer(LONG_PRESS_SECONDS, lambda: long_press_callback(key), False)
-    else:
-        await websocket_broadcast(encode({"event": "keyUp", "args": button.uuid}))
+        for key in range(deck.key_count()):
+            # Only add if not already known
+            if not isinstance(self.registry.get((serial, key)), SDButton):
+                position = get_position(deck, key)
+                new_button = SDButton(
+                    {
+                        "uuid": self.new_uuid(),
+                        "device": serial,
+                        "position": {"x": position.y_pos, "y": position.x_pos},
+                        "svg": DEFAULT_ICON,
+                    }
+                )
+                self.registry.save((serial, key), new_button)
 
-    now = datetime.now()
+        self.get_writer(deck).invalidate()
+        await self.paint_buttons(deck)
 
-    db_button_state = get_button_state(key)
+        deck.set_key_callback_async(self.on_key_change)
 
-    if not isinstance(db_button_state, tuple):
-        write_button_state(key, state, now.strftime(DATETIME_FORMAT))
-        return
+        return SDDevice(
+            {
+                "id": serial,
+                "name": deck.deck_type(),
+                "size": {"columns": deck.KEY_COLS, "rows": deck.KEY_ROWS},
+                "type": 20,
+            }
+        )
 
-    write_button_state(key, state, now.strftime(DATETIME_FORMAT))
+    async def init_all(self):
+        """Load the buttons and init Stream Deck devices concurrently.
+
+        The decks are opened with one worker per device.
+        """
+        self.registry.load()
+        for key, config in self.registry.configs().items():
+            try:
+                self.configure_button(key, config)
+            except (ValueError, TypeError) as error:
+                print(f"Invalid config of button {format_key(key)}: {error}")
+        print(f"Found {len(self.streamdecks)} Stream Deck(s).")
+
+        visual_decks = [deck for deck in self.streamdecks if deck.is_visual()]
+        if len(visual_decks) == 0:
+            return
+
+        with ThreadPoolExecutor(
+            len(visual_decks), thread_name_prefix="streamdeckapi-init"
+        ) as executor:
+            new_devices = await asyncio.gather(
+                *(self.init_deck(deck, executor) for deck in visual_decks)
+            )
 
-    last_state: bool = db_button_state[0]
-    last_update: str = db_button_state[1]
-    last_update_datetime = datetime.strptime(last_update, DATETIME_FORMAT)
-    diff = now - last_update_datetime
+        self.devices.extend(new_devices)
+        self.snapshot.touch()
 
-    if last_state is True and state is False and diff.seconds < LONG_PRESS_SECONDS:
-        print("Single Tap detected")
-        await websocket_broadcast(encode({"event": "singleTap", "args": button.uuid}))
+    def close(self):
+        """Stop the background work and write what is left."""
+        self.gestures.cancel()
+        self.renderer.shutdown()
+        for writer in self.writers.values():
+            writer.stop()
+        self.registry.close()
+        if self.audit_log is not None:
+            self.audit_log.close()
 
 
-def update_button_icon(uuid: str, svg: str):
-    """Update a button icon."""
-    for deck in streamdecks:
-        if not deck.is_visual():
-            continue
+def get_query_int(request: web.Request, name: str) -> Optional[int]:
+    """Get an integer query parameter, None if missing or invalid."""
+    try:
+        return int(request.query[name])
+    except (KeyError, ValueError):
+        return None
 
-        if not deck.is_open():
-            deck.open()
 
-        button = get_button_by_uuid(uuid)
-        button_key = get_button_key(uuid)
-        if isinstance(button, SDButton) and button_key >= 0:
-            set_icon(deck, button_key, svg)
-            button.svg = svg
-            save_button(button_key, button)
+class NoConnectionScreen:
+    """Show an alert on all keys while no websocket client is connected.
 
+    The alert is rendered once per deck model and shown after the last client
+    left, the icons are restored as soon as a client connects again.
+    """
 
-def set_icon(deck: StreamDeck, key: int, svg: str):
-    """Draw an icon to the button."""
-    png_bytes = io.BytesIO()
-    cairosvg.svg2png(svg.encode("utf-8"), write_to=png_bytes)
+    def __init__(
+        self, server: StreamDeckServer, grace: float = NO_CONN_GRACE_SECONDS
+    ) -> None:
+        """Init no connection screen."""
+        self.server = server
+        self.grace = grace
+        self.shown = False
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._images: Dict[str, bytes] = {}
+
+    def on_clients_changed(self, count: int):
+        """Handle a changed number of websocket clients."""
+        if count == 0:
+            if self._timer is None and not self.shown:
+                self._timer = asyncio.get_running_loop().call_later(
+                    self.grace, lambda: asyncio.ensure_future(self.show())
+                )
+            return
 
-    icon = Image.open(png_bytes)
-    image = PILHelper.create_scaled_image(deck, icon)
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self.shown:
+            asyncio.ensure_future(self.restore())
 
-    deck.set_key_image(key, PILHelper.to_native_format(deck, image))
+    async def show(self):
+        """Show the alert on all decks."""
+        self._timer = None
+        print("No connection")
+        self.shown = True
+        # Icons submitted before must not overwrite the alert
+        self.server.icons.clear()
+        for deck in self.server.streamdecks:
+            if not deck.is_visual():
+                continue
 
+            image = self._images.get(deck.deck_type())
+            if image is None:
+                image = await self.server.renderer.render(deck, NO_CONN_ICON)
+                self._images[deck.deck_type()] = image
+            if not self.shown:
+                # A client connected while rendering
+                return
 
-def init_all():
-    """Init Stream Deck devices."""
-    print(f"Found {len(streamdecks)} Stream Deck(s).")
+            writer = self.server.get_writer(deck)
+            writer.clear()
+            for key in range(deck.key_count()):
+                writer.submit(key, image, PRIORITY_BULK)
 
-    for deck in streamdecks:
-        if not deck.is_visual():
-            continue
+    async def restore(self):
+        """Restore the icons of all decks."""
+        self.shown = False
+        for deck in self.server.streamdecks:
+            if deck.is_visual():
+                await self.server.paint_buttons(deck)
 
-        deck.open()
 
-        serial = deck.get_serial_number()
+def get_position(deck: StreamDeck, key: int) -> SDButtonPosition:
+    """Get the position of a key."""
+    return SDButtonPosition({"x": int(key / deck.KEY_COLS), "y": key % deck.KEY_COLS})
 
-        devices.append(
-            SDDevice(
-                {
-                    "id": serial,
-                    "name": deck.deck_type(),
-                    "size": {"columns": deck.KEY_COLS, "rows": deck.KEY_ROWS},
-                    "type": 20,
-                }
-            )
-        )
 
-        for key in range(deck.key_count()):
-            # Only add if not already in dict
-            button = get_button(key)
-            if not isinstance(button, SDButton):
-                position = get_position(deck, key)
-                new_button = SDButton(
-                    {
-                        "uuid": hri.get_new_id().lower().replace(" ", "-"),
-                        "device": serial,
-                        "position": {"x": position.y_pos, "y": position.x_pos},
-                        "svg": DEFAULT_ICON,
-                    }
-                )
-                save_button(key, new_button)
+def open_deck(deck: StreamDeck) -> str:
+    """Open and reset a deck, blocking.
 
+    Returns:
+        str: Serial number of the deck
+    """
+    deck.open()
+    with deck:
         deck.reset()
-        # Write svg to buttons
-        for key, button in get_buttons().items():
-            set_icon(deck, key, button.svg)
-
-        deck.set_key_callback_async(on_key_change)
+    return deck.get_serial_number()
 
 
 class Timer:
@@ -576,7 +1045,11 @@ class Timer:
 
     async def _job(self):
         await asyncio.sleep(self._interval)
-        await self._callback()
+        try:
+            await self._callback()
+        except Exception as error:  # pylint: disable=broad-except
+            # Keep the timer running, the next call may succeed
+            print(f"Error in timer callback {self._callback.__name__}: {error}")
         if self._repeating:
             self._task = asyncio.ensure_future(self._job())
 
@@ -600,6 +1073,8 @@ def get_local_ip():
 
 def start_zeroconf():
     """Start Zeroconf server."""
+    # pylint: disable-next=import-outside-toplevel
+    from zeroconf import ServiceInfo, Zeroconf
 
     host = get_local_ip()
 
@@ -621,11 +1096,116 @@ def start_zeroconf():
     zeroconf.register_service(info)
 
 
+def parse_models(value: str) -> List[str]:
+    """Parse comma separated fake deck models."""
+    models = value.split(",")
+    unknown = [model for model in models if model not in FAKE_DECK_MODELS]
+    if len(unknown) > 0:
+        raise argparse.ArgumentTypeError(f"unknown models {', '.join(unknown)}")
+    return models
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        prog="streamdeckapi-server", description="Stream Deck API Server"
+    )
+    parser.add_argument(
+        "--db-file",
+        default=DB_FILE,
+        metavar="FILE",
+        help="SQLite database of the buttons (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--fake-decks",
+        type=parse_models,
+        metavar="MODELS",
+        help="serve in-memory decks instead of USB decks, comma separated models "
+        f"({', '.join(FAKE_DECK_MODELS)}), e.g. xl,mini",
+    )
+    parser.add_argument(
+        "--fake-write-latency",
+        type=float,
+        default=0,
+        metavar="MS",
+        help="time each key image write to a fake deck takes (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--audit-log",
+        metavar="FILE",
+        help="append every key change to FILE (JSON lines)",
+    )
+    parser.add_argument(
+        "--render-executor",
+        choices=["process", "thread"],
+        default=RENDER_EXECUTOR,
+        help="worker pool used to render svgs (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--render-workers",
+        type=int,
+        default=RENDER_WORKERS,
+        metavar="N",
+        help="number of render workers (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--min-frame-interval",
+        type=int,
+        default=MIN_FRAME_INTERVAL_MS,
+        metavar="MS",
+        help="minimum time between two icons of a key (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--ws-queue-size",
+        type=int,
+        default=WS_QUEUE_SIZE,
+        metavar="N",
+        help="messages queued per websocket client (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--ws-max-drops",
+        type=int,
+        default=WS_MAX_DROPS,
+        metavar="N",
+        help="disconnect a websocket client after N dropped status messages "
+        f"within {WS_DROP_INTERVAL_SECONDS} s (default: %(default)s)",
+    )
+    return parser.parse_args(argv)
+
+
 def start():
     """Entrypoint."""
-    init_all()
+    args = parse_args()
+
+    if args.fake_decks is not None:
+        # Only needed for development and benchmarks
+        # pylint: disable-next=import-outside-toplevel
+        from streamdeckapi.fake import create_fake_decks
+
+        streamdecks = create_fake_decks(args.fake_decks, args.fake_write_latency / 1000)
+    else:
+        # Loads the USB libraries, so only when actually serving decks
+        # pylint: disable-next=import-outside-toplevel
+        from StreamDeck.DeviceManager import DeviceManager
+
+        streamdecks = DeviceManager().enumerate()
+
+    server = StreamDeckServer(
+        streamdecks,
+        db_file=args.db_file,
+        render_executor=create_executor(args.render_executor, args.render_workers),
+        min_frame_interval_ms=args.min_frame_interval,
+        ws_queue_size=args.ws_queue_size,
+        ws_max_drops=args.ws_max_drops,
+    )
 
     loop = asyncio.get_event_loop()
+    loop.run_until_complete(server.init_all())
+
+    if args.audit_log is not None:
+        server.audit_log = KeyAuditLog(args.audit_log)
+        server.audit_log.start()
+
     executor = ProcessPoolExecutor(2)
 
     # Zeroconf server
@@ -633,11 +1213,19 @@ def start():
 
     # API server
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(start_server_async())
+    loop.run_until_complete(server.start_server_async())
+
+    try:
+        # Stop like on Ctrl+C, so systemd or docker stop don't lose changes
+        loop.add_signal_handler(signal.SIGTERM, loop.stop)
+    except NotImplementedError:
+        # Not available on Windows
+        pass
 
     try:
         loop.run_forever()
     except KeyboardInterrupt:
         pass
 
+    server.close()
     loop.close()
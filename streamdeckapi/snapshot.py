@@ -0,0 +1,168 @@
+"""Stream Deck API status snapshot."""
+
+import time
+from typing import Dict, List, Optional, Set
+
+from streamdeckapi.registry import ButtonKey, ButtonRegistry, format_key
+from streamdeckapi.tools import json_dumps
+from streamdeckapi.types import SDApplication, SDDevice
+
+
+class StatusSnapshot:
+    """Versioned snapshot of the server status.
+
+    The status is serialized once per version and shared by all HTTP responses
+    and websocket messages until the next change. The version of every change
+    is remembered, so clients can be sent only what changed since the version
+    they know.
+    """
+
+    def __init__(
+        self,
+        application: SDApplication,
+        devices: List[SDDevice],
+        registry: ButtonRegistry,
+    ) -> None:
+        """Init status snapshot."""
+        self._application = application
+        self._devices = devices
+        self._registry = registry
+        # Tells versions of different server runs apart
+        self._epoch = f"{time.time_ns():x}"
+        self.version = 0
+        self._button_versions: Dict[ButtonKey, int] = {}
+        self._devices_version = 0
+        self._json: Optional[str] = None
+        self._body: Optional[bytes] = None
+        self._message: Optional[str] = None
+        self._deltas: Dict[int, str] = {}
+
+    @property
+    def epoch(self) -> str:
+        """Identifier of this server run."""
+        return self._epoch
+
+    @property
+    def etag(self) -> str:
+        """Entity tag of the current version."""
+        return f'"{self._epoch}-{self.version}"'
+
+    def touch(self, key: Optional[ButtonKey] = None):
+        """Mark a button as changed, or the devices if no key is given."""
+        self.version += 1
+        if key is None:
+            self._devices_version = self.version
+        else:
+            self._button_versions[key] = self.version
+        self._json = None
+        self._body = None
+        self._message = None
+        self._deltas.clear()
+
+    def json(self, keys: Optional[Set[ButtonKey]] = None) -> str:
+        """Get the status as JSON.
+
+        Args:
+            keys (Set[ButtonKey] or None): Only include these buttons, all if None
+        """
+        if keys is not None:
+            return self._status_json(keys)
+        if self._json is None:
+            self._json = self._status_json()
+        return self._json
+
+    def _status_json(self, keys: Optional[Set[ButtonKey]] = None) -> str:
+        return json_dumps(
+            {
+                "version": self.version,
+                "devices": [device.to_dict() for device in self._devices],
+                "application": self._application.to_dict(),
+                "buttons": {
+                    format_key(key): button.to_dict()
+                    for key, button in self._registry.all().items()
+                    if keys is None or key in keys
+                },
+            }
+        )
+
+    def body(self) -> bytes:
+        """Get the status as encoded JSON."""
+        if self._body is None:
+            self._body = self.json().encode("utf-8")
+        return self._body
+
+    def message(self, keys: Optional[Set[ButtonKey]] = None) -> str:
+        """Get the status as websocket message.
+
+        Args:
+            keys (Set[ButtonKey] or None): Only include these buttons, all if None
+        """
+        if keys is not None:
+            return '{"event": "status", "args": ' + self.json(keys) + "}"
+        if self._message is None:
+            self._message = '{"event": "status", "args": ' + self.json() + "}"
+        return self._message
+
+    def delta_message(
+        self, since: int, keys: Optional[Set[ButtonKey]] = None
+    ) -> Optional[str]:
+        """Get the changes after a version as websocket message.
+
+        Args:
+            since (int): Version known by the client
+            keys (Set[ButtonKey] or None): Only include these buttons, all if None
+
+        Returns:
+            str or None if the version is unknown
+        """
+        if since < 0 or since > self.version:
+            return None
+        message = self._deltas.get(since) if keys is None else None
+        if message is None:
+            delta = {
+                "version": self.version,
+                "since": since,
+                "buttons": {},
+            }
+            for key, version in self._button_versions.items():
+                button = self._registry.get(key)
+                if (
+                    version > since
+                    and button is not None
+                    and (keys is None or key in keys)
+                ):
+                    delta["buttons"][format_key(key)] = button.to_dict()
+            if self._devices_version > since:
+                delta["devices"] = [device.to_dict() for device in self._devices]
+            message = json_dumps({"event": "statusDelta", "args": delta})
+            if keys is None:
+                self._deltas[since] = message
+        return message
+
+    def heartbeat_message(self) -> str:
+        """Get a websocket message telling the current version."""
+        return json_dumps({"event": "heartbeat", "args": {"version": self.version}})
+
+    def button_etag(self, key: ButtonKey) -> str:
+        """Entity tag of the current version of a button."""
+        version = self._button_versions.get(key, 0)
+        return f'"{self._epoch}-{format_key(key)}-{version}"'
+
+    def matches(self, if_none_match: Optional[str], etag: Optional[str] = None) -> bool:
+        """Check if an If-None-Match header matches an entity tag.
+
+        Args:
+            if_none_match (str or None): Header sent by the client
+            etag (str or None): Entity tag to check, the status one if None
+        """
+        if if_none_match is None:
+            return False
+        if etag is None:
+            etag = self.etag
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            if tag in ("*", etag):
+                return True
+        return False
@@ -1,7 +1,55 @@
 """Stream Deck API Tools."""
 
+import json
+from typing import Any, Callable
+
 from .types import SDInfo
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _stdlib_dumps(obj: Any) -> str:
+    return json.dumps(obj, separators=(",", ":"))
+
+
+def _orjson_dumps(obj: Any) -> str:
+    return orjson.dumps(obj).decode("utf-8")
+
+
+if orjson is not None:
+    _json_dumps: Callable[[Any], str] = _orjson_dumps
+    _json_loads: Callable[[Any], Any] = orjson.loads
+else:
+    _json_dumps = _stdlib_dumps
+    _json_loads = json.loads
+
+
+def set_json_backend(dumps: Callable[[Any], str], loads: Callable[[Any], Any]):
+    """Use another JSON library, e.g. `set_json_backend(json.dumps, json.loads)`.
+
+    By default orjson is used if installed, the standard library otherwise.
+    """
+    global _json_dumps, _json_loads  # pylint: disable=global-statement
+    _json_dumps = dumps
+    _json_loads = loads
+
+
+def json_dumps(obj: Any) -> str:
+    """Serialize an object to JSON with the selected backend."""
+    return _json_dumps(obj)
+
+
+def json_loads(data: Any) -> Any:
+    """Parse JSON with the selected backend.
+
+    Raises:
+        ValueError: Invalid JSON
+    """
+    return _json_loads(data)
+
 
 def get_model(info: SDInfo) -> str:
     """Get Stream Deck model."""
@@ -1,10 +1,12 @@
 """Stream Deck API types."""
-from typing import List, Dict
+from typing import Dict, List, Optional
 
 
 class SDApplication:
     """Stream Deck Application Type."""
 
+    __slots__ = ("font", "language", "platform", "platform_version", "version")
+
     font: str
     language: str
     platform: str
@@ -19,10 +21,27 @@ class SDApplication:
         self.platform_version = obj["platformVersion"]
         self.version = obj["version"]
 
+    @classmethod
+    def from_dict(cls, obj: dict) -> "SDApplication":
+        """Create Stream Deck Application object from its wire representation."""
+        return cls(obj)
+
+    def to_dict(self) -> dict:
+        """Get the wire representation."""
+        return {
+            "font": self.font,
+            "language": self.language,
+            "platform": self.platform,
+            "platformVersion": self.platform_version,
+            "version": self.version,
+        }
+
 
 class SDSize:
     """Stream Deck Size Type."""
 
+    __slots__ = ("columns", "rows")
+
     columns: int
     rows: int
 
@@ -31,10 +50,21 @@ class SDSize:
         self.columns = obj["columns"]
         self.rows = obj["rows"]
 
+    @classmethod
+    def from_dict(cls, obj: dict) -> "SDSize":
+        """Create Stream Deck Size object from its wire representation."""
+        return cls(obj)
+
+    def to_dict(self) -> dict:
+        """Get the wire representation."""
+        return {"columns": self.columns, "rows": self.rows}
+
 
 class SDDevice:
     """Stream Deck Device Type."""
 
+    __slots__ = ("id", "name", "type", "size")
+
     id: str
     name: str
     type: int
@@ -47,10 +77,26 @@ class SDDevice:
         self.type = obj["type"]
         self.size = SDSize(obj["size"])
 
+    @classmethod
+    def from_dict(cls, obj: dict) -> "SDDevice":
+        """Create Stream Deck Device object from its wire representation."""
+        return cls(obj)
+
+    def to_dict(self) -> dict:
+        """Get the wire representation."""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "type": self.type,
+            "size": self.size.to_dict(),
+        }
+
 
 class SDButtonPosition:
     """Stream Deck Button Position Type."""
 
+    __slots__ = ("x_pos", "y_pos")
+
     x_pos: int
     y_pos: int
 
@@ -59,10 +105,21 @@ class SDButtonPosition:
         self.x_pos = obj["x"]
         self.y_pos = obj["y"]
 
+    @classmethod
+    def from_dict(cls, obj: dict) -> "SDButtonPosition":
+        """Create Stream Deck Button Position object from its wire representation."""
+        return cls(obj)
+
+    def to_dict(self) -> dict:
+        """Get the wire representation."""
+        return {"x": self.x_pos, "y": self.y_pos}
+
 
 class SDButton:
     """Stream Deck Button Type."""
 
+    __slots__ = ("uuid", "device", "position", "svg")
+
     uuid: str
     device: str
     position: SDButtonPosition
@@ -75,38 +132,116 @@ class SDButton:
         self.svg = obj["svg"]
         self.position = SDButtonPosition(obj["position"])
 
+    @classmethod
+    def from_dict(cls, obj: dict) -> "SDButton":
+        """Create Stream Deck Button object from its wire representation."""
+        return cls(obj)
+
+    def to_dict(self) -> dict:
+        """Get the wire representation."""
+        return {
+            "uuid": self.uuid,
+            "device": self.device,
+            "position": self.position.to_dict(),
+            "svg": self.svg,
+        }
+
 
 class SDInfo(dict):
-    """Stream Deck Info Type."""
+    """Stream Deck Info Type.
+
+    The buttons are created from the raw status when they are first accessed.
+    """
+
+    __slots__ = ("application", "version", "devices", "_buttons", "_with_svg")
 
     application: SDApplication
+    version: int
+    devices: List[SDDevice]
 
-    def __init__(self, obj: dict) -> None:
-        """Init Stream Deck Info object."""
-        self.devices: List[SDDevice] = []
-        self.buttons: Dict[str, SDButton] = {}
+    def __init__(self, obj: dict, with_svg: bool = True) -> None:
+        """Init Stream Deck Info object.
+
+        Args:
+            obj (dict): Raw status, its buttons lose their svg without icons
+            with_svg (bool): Keep the icons of the buttons, their svg is None otherwise
+        """
+        if not with_svg:
+            for button in obj["buttons"].values():
+                _drop_svg(button)
 
         dict.__init__(self, obj)
+        self.version = obj.get("version", 0)
         self.application = SDApplication(obj["application"])
-        for device in obj["devices"]:
-            self.devices.append(SDDevice(device))
-        for _id in obj["buttons"]:
-            self.buttons.update({_id: SDButton(obj["buttons"][_id])})
+        self.devices = [SDDevice(device) for device in obj["devices"]]
+        self._buttons: Optional[Dict[str, SDButton]] = None
+        self._with_svg = with_svg
+
+    @property
+    def buttons(self) -> Dict[str, SDButton]:
+        """Buttons by their key."""
+        if self._buttons is None:
+            self._buttons = {
+                _id: SDButton(button) for _id, button in self["buttons"].items()
+            }
+        return self._buttons
+
+    @classmethod
+    def from_dict(cls, obj: dict) -> "SDInfo":
+        """Create Stream Deck Info object from its wire representation."""
+        return cls(obj)
+
+    def apply_delta(self, delta: dict):
+        """Apply the changes of a status delta."""
+        for _id, button in delta["buttons"].items():
+            if not self._with_svg:
+                _drop_svg(button)
+            self["buttons"][_id] = button
+            if self._buttons is not None:
+                self._buttons[_id] = SDButton(button)
+        if "devices" in delta:
+            self.devices = [SDDevice(device) for device in delta["devices"]]
+            self["devices"] = delta["devices"]
+        self.version = delta["version"]
+        self["version"] = delta["version"]
+
+    def to_dict(self) -> dict:
+        """Get the wire representation."""
+        return {
+            "version": self.version,
+            "devices": [device.to_dict() for device in self.devices],
+            "application": self.application.to_dict(),
+            "buttons": {
+                str(_id): button.to_dict() for _id, button in self.buttons.items()
+            },
+        }
+
+
+def _drop_svg(button: dict):
+    """Drop the icon of a freshly parsed raw button, saves copying it."""
+    button["svg"] = None
 
 
 class SDWebsocketMessage:
     """Stream Deck Websocket Message Type."""
 
+    __slots__ = ("event", "args")
+
     event: str
     args: any
 
-    def __init__(self, obj: dict) -> None:
-        """Init Stream Deck Websocket Message object."""
+    def __init__(self, obj: dict, with_svg: bool = True) -> None:
+        """Init Stream Deck Websocket Message object.
+
+        Args:
+            obj (dict): Raw message
+            with_svg (bool): Keep the icons of the buttons in a status
+        """
         self.event = obj["event"]
         if obj["args"] == {}:
             self.args = {}
             return
-        if isinstance(obj["args"], str):
+        if isinstance(obj["args"], str) or self.event != "status":
             self.args = obj["args"]
             return
-        self.args = SDInfo(obj["args"])
+        self.args = SDInfo(obj["args"], with_svg)
@@ -0,0 +1,216 @@
+"""Stream Deck API device writer."""
+
+import asyncio
+import hashlib
+import itertools
+import queue
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from StreamDeck.Devices.StreamDeck import StreamDeck
+
+from streamdeckapi.const import MIN_FRAME_INTERVAL_MS
+from streamdeckapi.registry import ButtonKey
+from streamdeckapi.render import Renderer
+
+# Lower values are written first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+_PRIORITY_STOP = 2
+
+
+class DeckWriter:
+    """Write key images to a deck on a dedicated thread.
+
+    Interactive updates are written before queued bulk refreshes. Only the
+    most recently submitted image of a key is written, older queued images of
+    the same key are skipped, as are images the key already shows.
+    """
+
+    def __init__(
+        self, deck: StreamDeck, on_write: Optional[Callable[[float], None]] = None
+    ) -> None:
+        """Init deck writer.
+
+        Args:
+            deck (StreamDeck): Deck to write to
+            on_write (Callable[[float], None] or None): Called with the seconds of each write
+        """
+        self.deck = deck
+        self.on_write = on_write
+        self._queue: queue.PriorityQueue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._latest: Dict[int, int] = {}
+        self._written: Dict[int, bytes] = {}
+        self.skipped = 0
+        self._thread = threading.Thread(
+            target=self._run, name=f"streamdeckapi-writer-{deck.id()}", daemon=True
+        )
+
+    @property
+    def depth(self) -> int:
+        """Number of queued writes."""
+        return self._queue.qsize()
+
+    def start(self):
+        """Start the writer thread."""
+        self._thread.start()
+
+    def submit(self, key: int, image: bytes, priority: int = PRIORITY_BULK):
+        """Queue a key image, never blocks."""
+        order = next(self._order)
+        self._latest[key] = order
+        self._queue.put((priority, order, key, image))
+
+    def _run(self):
+        while True:
+            priority, order, key, image = self._queue.get()
+            if priority == _PRIORITY_STOP:
+                return
+            if self._latest.get(key) != order:
+                continue
+            digest = hashlib.blake2b(image, digest_size=16).digest()
+            if self._written.get(key) == digest:
+                self.skipped += 1
+                continue
+            try:
+                started = time.perf_counter()
+                with self.deck:
+                    self.deck.set_key_image(key, image)
+                if self.on_write is not None:
+                    self.on_write(time.perf_counter() - started)
+                self._written[key] = digest
+            except Exception as error:  # pylint: disable=broad-except
+                # Keep the thread running, a failed write must not stop the deck
+                self._written.pop(key, None)
+                print(f"Error writing key {key} of {self.deck.id()}: {error}")
+
+    def clear(self):
+        """Drop all queued writes, a write in progress still finishes."""
+        self._latest.clear()
+
+    def invalidate(self):
+        """Forget what the keys show, e.g. after a reset of the deck."""
+        self._written.clear()
+
+    def stop(self, timeout: float = 5):
+        """Write what is queued and stop the writer thread."""
+        if not self._thread.is_alive():
+            return
+        self._queue.put((_PRIORITY_STOP, next(self._order), -1, b""))
+        self._thread.join(timeout)
+
+
+class _KeySlot:
+    """Pending icon of a key."""
+
+    def __init__(self) -> None:
+        """Init key slot."""
+        self.svg: Optional[str] = None
+        self.priority = PRIORITY_INTERACTIVE
+        self.task: Optional[asyncio.Task] = None
+        self.last_frame = 0.0
+
+
+class IconUpdater:
+    """Coalesce icon updates per key before they are rendered and written.
+
+    Each key renders at most one icon at a time and at most one per minimum
+    frame interval. An icon that is replaced before its turn is dropped, the
+    latest icon is always written. Icons submitted before `clear` are never
+    written, not even those being rendered.
+    """
+
+    def __init__(
+        self,
+        renderer: Renderer,
+        get_writer: Callable[[StreamDeck], DeckWriter],
+        min_frame_interval_ms: int = MIN_FRAME_INTERVAL_MS,
+    ) -> None:
+        """Init icon updater.
+
+        Args:
+            renderer (Renderer): Renderer for the icons
+            get_writer (Callable[[StreamDeck], DeckWriter]): Writer of a deck
+            min_frame_interval_ms (int): Default minimum time between two icons of a key
+        """
+        self._renderer = renderer
+        self._get_writer = get_writer
+        self.min_frame_interval_ms = min_frame_interval_ms
+        self._intervals: Dict[ButtonKey, int] = {}
+        self._slots: Dict[ButtonKey, _KeySlot] = {}
+        # Bumped by clear, renders of an older generation are dropped
+        self._generation = 0
+        self.submitted = 0
+        self.dropped = 0
+        self.unchanged = 0
+
+    def min_frame_interval(self, key: ButtonKey) -> int:
+        """Get the minimum frame interval of a key in milliseconds."""
+        return self._intervals.get(key, self.min_frame_interval_ms)
+
+    def set_min_frame_interval(self, key: ButtonKey, interval_ms: int):
+        """Set the minimum frame interval of a key in milliseconds."""
+        if (
+            isinstance(interval_ms, bool)
+            or not isinstance(interval_ms, int)
+            or interval_ms < 0
+        ):
+            raise ValueError("minFrameIntervalMs has to be a positive number")
+        self._intervals[key] = interval_ms
+
+    def clear(self):
+        """Drop all pending icons and those being rendered."""
+        self._generation += 1
+        for slot in self._slots.values():
+            if slot.svg is not None:
+                slot.svg = None
+                self.dropped += 1
+
+    def submit(
+        self,
+        deck: StreamDeck,
+        key: ButtonKey,
+        svg: str,
+        priority: int = PRIORITY_INTERACTIVE,
+    ):
+        """Queue an icon for a key of a deck, replacing a pending one."""
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = _KeySlot()
+
+        self.submitted += 1
+        if slot.svg is not None:
+            self.dropped += 1
+        slot.svg = svg
+        slot.priority = priority
+        if slot.task is None:
+            slot.task = asyncio.ensure_future(self._run(deck, key, slot))
+
+    async def _run(self, deck: StreamDeck, key: ButtonKey, slot: _KeySlot):
+        try:
+            while slot.svg is not None:
+                wait = (
+                    slot.last_frame
+                    + self.min_frame_interval(key) / 1000
+                    - time.monotonic()
+                )
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+                svg = slot.svg
+                slot.svg = None
+                generation = self._generation
+                try:
+                    image = await self._renderer.render(deck, svg)
+                except Exception as error:  # pylint: disable=broad-except
+                    print(f"Error rendering icon for key {key[1]}: {error}")
+                    continue
+                if generation != self._generation:
+                    self.dropped += 1
+                    continue
+                self._get_writer(deck).submit(key[1], image, slot.priority)
+                slot.last_frame = time.monotonic()
+        finally:
+            slot.task = None
@@ -3,8 +3,8 @@ import json
 from streamdeckapi import SDWebsocketMessage, StreamDeckApi
 
 async def __main__():
-    deck = StreamDeckApi("localhost")
-    info = await deck.get_info(False)
+    async with StreamDeckApi("localhost") as deck:
+        info = await deck.get_info()
 
     if info is None:
         print("Error getting info")
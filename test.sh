@@ -7,3 +7,4 @@
 
 # Run python tests
 python test.py
+python -m unittest discover -s ./tests -p "*test.py"
@@ -0,0 +1,100 @@
+"""Tests for the Stream Deck API client, on a server with a fake deck."""
+
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+from server_test import ServerTestCase
+
+from streamdeckapi.api import StreamDeckApi
+
+
+class ClientCacheTest(ServerTestCase):
+    """Icons and info cached by the client."""
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        port = mock.patch("streamdeckapi.api.PLUGIN_PORT", self.client.port)
+        port.start()
+        self.addCleanup(port.stop)
+        self.api = StreamDeckApi(self.client.host, cache=True)
+        self.statuses = []
+
+        get_request = self.api._get_request  # pylint: disable=protected-access
+
+        async def record_status(url, etag=None):
+            res = await get_request(url, etag)
+            self.statuses.append(None if res is None else res.status)
+            return res
+
+        self.api._get_request = record_status  # pylint: disable=protected-access
+
+    async def asyncTearDown(self):
+        await self.api.close()
+        await super().asyncTearDown()
+
+    async def wait_for_websocket(self, timeout: float = 2):
+        """Start the websocket client and wait until it knows the status."""
+        self.api.start_websocket_loop()
+        deadline = time.monotonic() + timeout
+        while self.api.info is None:
+            if time.monotonic() > deadline:
+                self.fail(f"Websocket client is {self.api.state}")
+            await asyncio.sleep(0.01)
+
+    async def test_get_icon_revalidates_cache(self):
+        uuid = self.uuid(0)
+        svg = await self.api.get_icon(uuid)
+        self.assertEqual(await self.api.get_icon(uuid), svg)
+        self.assertEqual(self.statuses, [200, 304])
+
+        self.server.update_button_icon(uuid, "<svg>new</svg>")
+        self.assertEqual(await self.api.get_icon(uuid), "<svg>new</svg>")
+        self.assertEqual(self.statuses[-1], 200)
+
+    async def test_get_icon_with_websocket_uses_cache(self):
+        await self.wait_for_websocket()
+        uuid = self.uuid(0)
+        svg = self.server.registry.get_by_uuid(uuid).svg
+
+        # Requested over HTTP, so the icon is only revalidated the second time
+        self.assertEqual(await self.api.get_icon(uuid), svg)
+        self.assertEqual(await self.api.get_icon(uuid), svg)
+        self.assertEqual(self.statuses, [200, 304])
+
+    async def test_get_info_revalidates_cache(self):
+        info = await self.api.get_info()
+        self.assertIs(await self.api.get_info(), info)
+        self.assertEqual(self.statuses, [200, 304])
+
+    async def test_unchanged_icon_not_sent(self):
+        uuid = self.uuid(0)
+        self.assertTrue(await self.api.update_icon(uuid, "<svg>1</svg>"))
+        # Without the websocket, the client doesn't notice other changes
+        self.server.update_button_icon(uuid, "<svg>2</svg>")
+
+        self.assertTrue(await self.api.update_icon(uuid, "<svg>1</svg>"))
+        self.assertEqual(self.server.registry.get_by_uuid(uuid).svg, "<svg>2</svg>")
+
+    async def test_status_updates_cached_icons(self):
+        await self.wait_for_websocket()
+        uuid = self.uuid(0)
+        version = self.api.info.version
+
+        self.server.update_button_icon(uuid, "<svg>new</svg>")
+        await self.server.broadcast_status()
+        deadline = time.monotonic() + 1
+        while self.api.info.version == version:
+            if time.monotonic() > deadline:
+                self.fail("Status update not received")
+            await asyncio.sleep(0.01)
+
+        # Cached from the status, so setting it again sends nothing
+        self.server.update_button_icon(uuid, "<svg>other</svg>")
+        self.assertTrue(await self.api.update_icon(uuid, "<svg>new</svg>"))
+        self.assertEqual(self.server.registry.get_by_uuid(uuid).svg, "<svg>other</svg>")
+
+
+if __name__ == "__main__":
+    unittest.main()
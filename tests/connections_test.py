@@ -0,0 +1,171 @@
+"""Tests for the Stream Deck API websocket connections."""
+
+import asyncio
+import unittest
+
+from streamdeckapi.connections import (
+    EventBuffer,
+    Subscription,
+    Subscriptions,
+    WebsocketClient,
+)
+from streamdeckapi.tools import json_loads
+
+
+class EventBufferTest(unittest.TestCase):
+    """Replay of missed events after a reconnect."""
+
+    def test_numbers_events(self):
+        events = EventBuffer()
+        message = json_loads(events.add("keyDown", "button", "AL123"))
+
+        self.assertEqual(message, {"event": "keyDown", "args": "button", "seq": 1})
+        self.assertEqual(events.seq, 1)
+
+    def test_replays_missed_events(self):
+        events = EventBuffer()
+        for event in ("keyDown", "keyUp", "singleTap"):
+            events.add(event, "button", "AL123")
+
+        replay = [json_loads(message) for message in events.since(1)]
+
+        self.assertEqual(
+            [message["event"] for message in replay], ["keyUp", "singleTap"]
+        )
+        self.assertEqual([message["seq"] for message in replay], [2, 3])
+        self.assertEqual(events.since(3), [])
+
+    def test_unknown_position(self):
+        events = EventBuffer()
+        events.add("keyDown", "button", "AL123")
+
+        self.assertIsNone(events.since(-1))
+        self.assertIsNone(events.since(2))
+
+    def test_events_not_buffered_anymore(self):
+        events = EventBuffer(size=2)
+        for _ in range(4):
+            events.add("keyDown", "button", "AL123")
+
+        self.assertIsNone(events.since(1))
+        self.assertEqual(len(events.since(2)), 2)
+
+    def test_replays_subscribed_events_only(self):
+        events = EventBuffer()
+        events.add("keyDown", "first", "AL123")
+        events.add("keyDown", "second", "AL456")
+        events.add("keyUp", "first", "AL123")
+
+        replay = events.since(
+            0, Subscription({"devices": ["AL123"], "events": ["keyUp"]})
+        )
+
+        self.assertEqual([json_loads(message)["seq"] for message in replay], [3])
+
+
+class SubscriptionsTest(unittest.TestCase):
+    """Index from buttons, devices and events to the subscribed clients."""
+
+    def setUp(self):
+        self.subscriptions = Subscriptions()
+
+    def subscribe(self, client: str, **subscription):
+        self.subscriptions.add(client, Subscription(subscription))
+
+    def test_clients_of_button_event(self):
+        self.subscribe("all")
+        self.subscribe("button", buttons=["first"])
+        self.subscribe("device", devices=["AL123"])
+        self.subscribe("gestures", events=["singleTap", "doubleTap"])
+        self.subscribe("other", buttons=["second"], events=["keyDown"])
+
+        self.assertEqual(
+            self.subscriptions.clients("first", "AL123", "keyDown"),
+            {"all", "button", "device"},
+        )
+        self.assertEqual(
+            self.subscriptions.clients("second", "AL456", "keyDown"), {"all", "other"}
+        )
+        self.assertEqual(
+            self.subscriptions.clients("second", "AL456", "singleTap"),
+            {"all", "gestures"},
+        )
+
+    def test_resubscribe_replaces_subscription(self):
+        self.subscribe("client", buttons=["first"])
+        self.subscribe("client", buttons=["second"])
+
+        self.assertEqual(self.subscriptions.clients("first", "AL123", "keyDown"), set())
+        self.assertEqual(
+            self.subscriptions.clients("second", "AL123", "keyDown"), {"client"}
+        )
+        self.assertEqual(self.subscriptions.get("client").buttons, {"second"})
+
+    def test_remove_client(self):
+        self.subscribe("client", buttons=["first"], events=["keyUp"])
+        self.subscriptions.remove("client")
+        # Removing twice is fine
+        self.subscriptions.remove("client")
+
+        self.assertEqual(self.subscriptions.clients("first", "AL123", "keyUp"), set())
+        self.assertIsNone(self.subscriptions.get("client").buttons)
+
+    def test_invalid_subscription(self):
+        for subscription in ({"buttons": [1]}, {"events": {"keyDown": True}}):
+            with self.subTest(subscription=subscription):
+                with self.assertRaises(ValueError):
+                    Subscription(subscription)
+
+
+class StalledWebSocket:
+    """Web socket that never finishes sending."""
+
+    def __init__(self) -> None:
+        self.closed = False
+
+    async def send_str(self, _):
+        await asyncio.Event().wait()
+
+    async def close(self):
+        self.closed = True
+
+
+class WebsocketClientTest(unittest.IsolatedAsyncioTestCase):
+    """Dropped status messages of slow clients."""
+
+    def setUp(self):
+        self.web_socket = StalledWebSocket()
+        self.client = WebsocketClient(self.web_socket, max_queue=2, max_drops=3)
+
+    async def test_drops_status_messages_first(self):
+        self.client.send("status 1", droppable=True)
+        self.client.send("event 1")
+        # The oldest status makes room
+        self.assertTrue(self.client.send("event 2"))
+        # Without queued status messages, a new one is dropped
+        self.assertFalse(self.client.send("status 2", droppable=True))
+
+        self.assertEqual(self.client.drops, 2)
+        self.assertEqual(self.client.depth, 2)
+        self.assertFalse(self.web_socket.closed)
+
+    async def test_limits_drops_per_interval(self):
+        self.client.send("event 1")
+        self.client.send("event 2")
+        for _ in range(2):
+            self.client.send("status", droppable=True)
+        self.assertEqual(self.client.take_interval_drops(), 2)
+
+        for _ in range(2):
+            self.client.send("status", droppable=True)
+        await asyncio.sleep(0)
+        self.assertFalse(self.web_socket.closed)
+
+        self.client.send("status", droppable=True)
+        await asyncio.sleep(0)
+        self.assertTrue(self.web_socket.closed)
+        self.assertEqual(self.client.drops, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+"""Tests for the Stream Deck API gesture recognizer."""
+
+import asyncio
+import unittest
+
+from streamdeckapi.keys import GestureConfig, GestureRecognizer
+
+KEY = ("AL123", 0)
+
+
+class GestureRecognizerTest(unittest.IsolatedAsyncioTestCase):
+    """Gestures detected from key changes."""
+
+    def setUp(self):
+        self.events = []
+        self.gestures = GestureRecognizer(lambda key, event: self.events.append(event))
+
+    def tearDown(self):
+        self.gestures.cancel()
+
+    def configure(self, **config):
+        self.gestures.configure(KEY, GestureConfig(config))
+
+    def tap(self):
+        self.gestures.key_down(KEY)
+        self.gestures.key_up(KEY)
+
+    async def test_single_tap_without_delay(self):
+        self.tap()
+        self.assertEqual(self.events, ["singleTap"])
+
+    async def test_single_tap_after_double_tap_window(self):
+        self.configure(doubleTapMs=20)
+        self.tap()
+        self.assertEqual(self.events, [])
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.events, ["singleTap"])
+
+    async def test_double_tap(self):
+        self.configure(doubleTapMs=100)
+        self.tap()
+        self.tap()
+        await asyncio.sleep(0.15)
+        self.assertEqual(self.events, ["doubleTap"])
+
+    async def test_long_press_and_hold_repeat(self):
+        self.configure(longPressMs=20, holdRepeatMs=20)
+        self.gestures.key_down(KEY)
+        await asyncio.sleep(0.07)
+        self.gestures.key_up(KEY)
+        self.assertEqual(self.events[0], "longPress")
+        self.assertIn("holdRepeat", self.events)
+        self.assertNotIn("singleTap", self.events)
+
+    async def test_disabled_long_press(self):
+        self.configure(longPressMs=0)
+        self.gestures.key_down(KEY)
+        await asyncio.sleep(0.03)
+        self.gestures.key_up(KEY)
+        self.assertEqual(self.events, ["singleTap"])
+
+    def test_invalid_config(self):
+        for config in (
+            {"longPressMs": -1},
+            {"doubleTapMs": "300"},
+            {"holdRepeatMs": True},
+        ):
+            with self.subTest(config=config):
+                with self.assertRaises(ValueError):
+                    GestureConfig(config)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+"""Tests for the Stream Deck API metrics."""
+
+import unittest
+
+from streamdeckapi.metrics import Histogram, format_labels, format_metric
+
+
+class FormatTest(unittest.TestCase):
+    """Counters and gauges in the Prometheus text format."""
+
+    def test_metric_without_labels(self):
+        self.assertEqual(
+            format_metric("streamdeckapi_clients", "gauge", "Connected clients", 2),
+            [
+                "# HELP streamdeckapi_clients Connected clients",
+                "# TYPE streamdeckapi_clients gauge",
+                "streamdeckapi_clients 2",
+            ],
+        )
+
+    def test_metric_with_labels(self):
+        samples = {
+            format_labels({"deck": "AL123"}): 3,
+            format_labels({"deck": "AL456"}): 0,
+        }
+        self.assertEqual(
+            format_metric("streamdeckapi_writes", "counter", "Key writes", samples)[2:],
+            [
+                'streamdeckapi_writes{deck="AL123"} 3',
+                'streamdeckapi_writes{deck="AL456"} 0',
+            ],
+        )
+
+    def test_labels_are_escaped(self):
+        self.assertEqual(format_labels({}), "")
+        self.assertEqual(
+            format_labels({"name": 'a "b"\\\n'}), '{name="a \\"b\\"\\\\\\n"}'
+        )
+
+
+class HistogramTest(unittest.TestCase):
+    """Latency histograms in the Prometheus text format."""
+
+    def test_collect(self):
+        histogram = Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+        for seconds in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(seconds)
+
+        self.assertEqual(
+            histogram.collect(),
+            [
+                "# HELP latency_seconds Latency",
+                "# TYPE latency_seconds histogram",
+                'latency_seconds_bucket{le="0.1"} 2',
+                'latency_seconds_bucket{le="1.0"} 3',
+                'latency_seconds_bucket{le="+Inf"} 4',
+                "latency_seconds_sum 2.65",
+                "latency_seconds_count 4",
+            ],
+        )
+
+    def test_collect_empty(self):
+        histogram = Histogram("latency_seconds", "Latency", buckets=(0.1,))
+        self.assertEqual(
+            histogram.collect()[2:],
+            [
+                'latency_seconds_bucket{le="0.1"} 0',
+                'latency_seconds_bucket{le="+Inf"} 0',
+                "latency_seconds_sum 0.0",
+                "latency_seconds_count 0",
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+"""Tests for the Stream Deck API button registry."""
+
+import base64
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from streamdeckapi.registry import SCHEMA_VERSION, ButtonRegistry
+from streamdeckapi.types import SDButton
+
+
+def encode(svg: str) -> str:
+    """Encode an svg like the database does."""
+    return base64.b64encode(svg.encode()).decode()
+
+
+def create_button(uuid: str, device: str = "AL123", svg: str = "<svg/>") -> SDButton:
+    """Create a button."""
+    return SDButton(
+        {"uuid": uuid, "device": device, "position": {"x": 0, "y": 0}, "svg": svg}
+    )
+
+
+class ButtonRegistryTest(unittest.TestCase):
+    """Migration and persistence of the button registry."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.directory.name, "streamdeckapi.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def create_version_0(self, rows):
+        """Create a database of version 0, buttons keyed by key only."""
+        database = sqlite3.connect(self.db_file)
+        with database:
+            database.execute(
+                """
+                    CREATE TABLE buttons(
+                       key integer PRIMARY KEY,
+                       uuid text NOT NULL,
+                       device text,
+                       x integer,
+                       y integer,
+                       svg text
+                    );"""
+            )
+            database.executemany("INSERT INTO buttons VALUES (?, ?, ?, ?, ?, ?)", rows)
+        database.close()
+
+    def open_registry(self) -> ButtonRegistry:
+        registry = ButtonRegistry(self.db_file)
+        self.addCleanup(registry.close)
+        registry.load()
+        return registry
+
+    def test_migrate_version_0(self):
+        self.create_version_0(
+            [
+                (0, "first", "AL123", 0, 0, encode("<svg>0</svg>")),
+                (1, "second", "AL123", 1, 0, encode("<svg>1</svg>")),
+                # Version 0 allowed the same uuid on several keys
+                (2, "second", "AL123", 2, 0, encode("<svg>2</svg>")),
+                # Buttons without a device can't be assigned to a deck
+                (3, "orphan", None, 3, 0, encode("<svg>3</svg>")),
+            ]
+        )
+
+        registry = self.open_registry()
+
+        self.assertEqual(len(registry.all()), 2)
+        self.assertEqual(registry.get(("AL123", 0)).svg, "<svg>0</svg>")
+        self.assertEqual(registry.get_key("second"), ("AL123", 2))
+        self.assertEqual(registry.get_by_uuid("second").svg, "<svg>2</svg>")
+        self.assertIsNone(registry.get_by_uuid("orphan"))
+
+        database = sqlite3.connect(self.db_file)
+        self.addCleanup(database.close)
+        self.assertEqual(
+            database.execute("PRAGMA user_version").fetchone()[0], SCHEMA_VERSION
+        )
+        tables = database.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        self.assertEqual([name for (name,) in tables], ["buttons"])
+
+    def test_migrated_database_is_writable(self):
+        self.create_version_0([(0, "first", "AL123", 0, 0, encode("<svg/>"))])
+        registry = self.open_registry()
+
+        registry.save(("AL123", 1), create_button("new"))
+        registry.save_config(("AL123", 0), {"doubleTapMs": 250})
+        self.assertEqual(registry.flush(), 2)
+        registry.close()
+
+        registry = self.open_registry()
+        self.assertEqual(registry.get_key("new"), ("AL123", 1))
+        self.assertEqual(registry.get_config(("AL123", 0)), {"doubleTapMs": 250})
+
+    def test_failed_write_keeps_buttons_queued(self):
+        registry = self.open_registry()
+        registry.save(("AL123", 0), create_button("first"))
+
+        def fail(_):
+            raise sqlite3.OperationalError("database is locked")
+
+        registry._write = fail  # pylint: disable=protected-access
+        with self.assertRaises(sqlite3.OperationalError):
+            registry.flush()
+        self.assertEqual(registry.pending, 1)
+
+        del registry._write  # pylint: disable=protected-access
+        self.assertEqual(registry.flush(), 1)
+        self.assertEqual(registry.pending, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
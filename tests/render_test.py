@@ -0,0 +1,61 @@
+"""Tests for the Stream Deck API render cache."""
+
+import unittest
+
+from streamdeckapi.render import RenderCache
+
+
+class RenderCacheTest(unittest.TestCase):
+    """Least recently used eviction of the render cache."""
+
+    def test_evicts_least_recently_used(self):
+        cache = RenderCache(max_entries=2)
+        cache.put("a", b"a")
+        cache.put("b", b"b")
+        self.assertEqual(cache.get("a"), b"a")
+
+        cache.put("c", b"c")
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), b"a")
+        self.assertEqual(cache.get("c"), b"c")
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_bounded_by_bytes(self):
+        cache = RenderCache(max_bytes=10)
+        cache.put("a", b"12345")
+        cache.put("b", b"12345")
+        cache.put("c", b"123")
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["bytes"], 8)
+
+    def test_replaces_image(self):
+        cache = RenderCache()
+        cache.put("a", b"old")
+        cache.put("a", b"newer")
+
+        self.assertEqual(cache.get("a"), b"newer")
+        self.assertEqual(cache.stats()["entries"], 1)
+        self.assertEqual(cache.stats()["bytes"], 5)
+
+    def test_skips_images_larger_than_cache(self):
+        cache = RenderCache(max_bytes=4)
+        cache.put("a", b"1234")
+        cache.put("b", b"12345")
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), b"1234")
+
+    def test_counts_hits_and_misses(self):
+        cache = RenderCache()
+        cache.put("a", b"a")
+        cache.get("a")
+        cache.get("b")
+
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,408 @@
+"""Tests for the Stream Deck API server, on fake decks."""
+
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from typing import Optional
+
+import aiohttp
+from aiohttp.test_utils import TestClient, TestServer
+
+from streamdeckapi.fake import FakeStreamDeck
+from streamdeckapi.server import StreamDeckServer
+
+
+async def render(_, svg: str) -> bytes:
+    """Render an svg to its bytes, so the tests don't need cairo."""
+    if "invalid" in svg:
+        raise ValueError("not an svg")
+    if "slow" in svg:
+        await asyncio.sleep(0.1)
+    return svg.encode()
+
+
+class ServerTestCase(unittest.IsolatedAsyncioTestCase):
+    """Server with a fake deck, served by a test client."""
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.deck = FakeStreamDeck("mini")
+        self.server = StreamDeckServer(
+            [self.deck], db_file=os.path.join(self.directory.name, "streamdeckapi.db")
+        )
+        self.server.renderer.render = render
+        await self.server.init_all()
+        self.client = TestClient(TestServer(self.server.create_runner().app))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        self.server.close()
+        self.deck.close()
+        self.directory.cleanup()
+
+    def uuid(self, key: int) -> str:
+        """Get the uuid of the button of a key."""
+        return self.server.registry.get((self.deck.get_serial_number(), key)).uuid
+
+    async def connect(self, url: str = "/") -> aiohttp.ClientWebSocketResponse:
+        """Connect a websocket client, skipping the connected message and status."""
+        web_socket = await self.client.ws_connect(url)
+        self.assertEqual((await self.receive(web_socket))["event"], "connected")
+        self.assertEqual((await self.receive(web_socket))["event"], "status")
+        return web_socket
+
+    async def receive(self, web_socket: aiohttp.ClientWebSocketResponse) -> dict:
+        """Receive a message, failing after a second."""
+        return await asyncio.wait_for(web_socket.receive_json(), 1)
+
+
+class KeyEventTest(ServerTestCase):
+    """Key events and gestures sent to websocket clients."""
+
+    async def test_key_events_before_gestures(self):
+        web_socket = await self.connect()
+        self.deck.tap(1)
+
+        messages = [await self.receive(web_socket) for _ in range(3)]
+
+        self.assertEqual(
+            [message["event"] for message in messages],
+            ["keyDown", "keyUp", "singleTap"],
+        )
+        self.assertEqual({message["args"] for message in messages}, {self.uuid(1)})
+        self.assertEqual([message["seq"] for message in messages], [1, 2, 3])
+
+
+class EventReplayTest(ServerTestCase):
+    """Events missed while reconnecting."""
+
+    async def test_resumed_connection_replays_events(self):
+        web_socket = await self.client.ws_connect("/")
+        connected = await self.receive(web_socket)
+        await web_socket.close()
+
+        self.deck.tap(1)
+        await asyncio.sleep(0.05)
+
+        epoch = connected["args"]["epoch"]
+        web_socket = await self.client.ws_connect(f"/?since=0&epoch={epoch}")
+        connected = await self.receive(web_socket)
+        self.assertTrue(connected["args"]["resumed"])
+        self.assertEqual(connected["args"]["seq"], 3)
+        replay = [await self.receive(web_socket) for _ in range(3)]
+        self.assertEqual(
+            [message["event"] for message in replay], ["keyDown", "keyUp", "singleTap"]
+        )
+        self.assertEqual((await self.receive(web_socket))["event"], "status")
+
+    async def test_other_epoch_is_not_resumed(self):
+        web_socket = await self.client.ws_connect("/?since=0&epoch=other")
+        connected = await self.receive(web_socket)
+        self.assertFalse(connected["args"]["resumed"])
+        self.assertEqual((await self.receive(web_socket))["event"], "status")
+
+
+class ConditionalRequestTest(ServerTestCase):
+    """Entity tags of the status and icons."""
+
+    async def get(self, url: str, etag: Optional[str] = None):
+        """Get a resource, conditionally if an entity tag is given."""
+        headers = {} if etag is None else {"If-None-Match": etag}
+        response = await self.client.get(url, headers=headers)
+        await response.read()
+        return response
+
+    async def test_info_not_modified(self):
+        response = await self.get("/sd/info")
+        self.assertEqual(response.status, 200)
+        etag = response.headers["ETag"]
+
+        response = await self.get("/sd/info", etag)
+        self.assertEqual(response.status, 304)
+        self.assertEqual(response.headers["ETag"], etag)
+
+        self.server.update_button_icon(self.uuid(0), "<svg>new</svg>")
+        response = await self.get("/sd/info", etag)
+        self.assertEqual(response.status, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    async def test_icon_not_modified(self):
+        url = f"/sd/icon/{self.uuid(0)}"
+        response = await self.get(url)
+        self.assertEqual(response.status, 200)
+        etag = response.headers["ETag"]
+
+        self.assertEqual((await self.get(url, etag)).status, 304)
+        # Other buttons don't change the icon
+        self.server.update_button_icon(self.uuid(1), "<svg>new</svg>")
+        self.assertEqual((await self.get(url, etag)).status, 304)
+
+        self.server.update_button_icon(self.uuid(0), "<svg>new</svg>")
+        response = await self.get(url, etag)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(await response.text(), "<svg>new</svg>")
+
+    async def test_unknown_icon(self):
+        self.assertEqual((await self.get("/sd/icon/unknown")).status, 404)
+
+
+class ConnectionTest(ServerTestCase):
+    """Websocket clients connecting and disconnecting."""
+
+    async def wait_for_disconnect(self, timeout: float = 1):
+        """Wait until no websocket client is connected."""
+        deadline = time.monotonic() + timeout
+        while len(self.server.websocket_connections) > 0:
+            if time.monotonic() > deadline:
+                self.fail("Websocket client is still connected")
+            await asyncio.sleep(0.001)
+
+    async def test_closed_client_is_removed(self):
+        web_socket = await self.connect()
+        self.assertEqual(len(self.server.websocket_connections), 1)
+
+        await web_socket.close()
+        await self.wait_for_disconnect()
+
+        serial = self.deck.get_serial_number()
+        self.assertEqual(
+            self.server.subscriptions.clients(self.uuid(0), serial, ""), set()
+        )
+
+    async def test_failed_handler_removes_client(self):
+        def fail(*_):
+            raise RuntimeError("Broken message handler")
+
+        self.server.handle_client_message = fail
+        web_socket = await self.connect()
+
+        with self.assertLogs("aiohttp.server", "ERROR"):
+            await web_socket.send_str("{}")
+            await self.wait_for_disconnect()
+
+        serial = self.deck.get_serial_number()
+        self.assertEqual(
+            self.server.subscriptions.clients(self.uuid(0), serial, ""), set()
+        )
+
+
+class StatusUpdateTest(ServerTestCase):
+    """Status updates broadcast to websocket clients."""
+
+    async def test_acknowledged_status(self):
+        web_socket = await self.connect()
+        version = self.server.snapshot.version
+        await web_socket.send_json({"event": "statusAck", "args": {"version": version}})
+        await asyncio.sleep(0.01)
+
+        await self.server.broadcast_status()
+        message = await self.receive(web_socket)
+        self.assertEqual(message, {"event": "heartbeat", "args": {"version": version}})
+
+        self.server.update_button_icon(self.uuid(2), "<svg>new</svg>")
+        await self.server.broadcast_status()
+        message = await self.receive(web_socket)
+        self.assertEqual(message["event"], "statusDelta")
+        self.assertEqual(message["args"]["since"], version)
+        self.assertEqual(
+            [button["uuid"] for button in message["args"]["buttons"].values()],
+            [self.uuid(2)],
+        )
+
+    async def test_unacknowledged_status(self):
+        web_socket = await self.connect()
+
+        # The full status was sent on connect
+        await self.server.broadcast_status()
+        self.assertEqual((await self.receive(web_socket))["event"], "heartbeat")
+
+        self.server.update_button_icon(self.uuid(2), "<svg>new</svg>")
+        await self.server.broadcast_status()
+        message = await self.receive(web_socket)
+        self.assertEqual(message["event"], "status")
+        self.assertEqual(message["args"]["version"], self.server.snapshot.version)
+
+
+class IconTest(ServerTestCase):
+    """Icons set over HTTP."""
+
+    async def set_icon(self, uuid: str, svg: str) -> str:
+        """Set an icon, returning the response text."""
+        response = await self.client.post(f"/sd/icon/{uuid}", data=svg)
+        return await response.text()
+
+    async def test_icons_saved_in_request_order(self):
+        uuid = self.uuid(0)
+        slow = asyncio.create_task(self.set_icon(uuid, "<svg>slow</svg>"))
+        await asyncio.sleep(0.01)
+
+        self.assertEqual(await self.set_icon(uuid, "<svg>fast</svg>"), "Icon changed")
+        # The slow icon finishes rendering last and is dropped
+        self.assertEqual(await slow, "Icon unchanged")
+
+        self.assertEqual(self.server.registry.get_by_uuid(uuid).svg, "<svg>fast</svg>")
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.deck.images[0], b"<svg>fast</svg>")
+
+
+class IconBatchTest(ServerTestCase):
+    """Icons of multiple buttons set at once."""
+
+    async def set_icons(self, icons: dict) -> dict:
+        """Set icons over HTTP, returning the results."""
+        response = await self.client.post("/sd/icons", json=icons)
+        self.assertEqual(response.status, 200)
+        return (await response.json())["results"]
+
+    def fail_writes(self):
+        """Fail all database writes."""
+
+        def fail(_):
+            raise sqlite3.OperationalError("database is locked")
+
+        self.server.registry._write = fail  # pylint: disable=protected-access
+
+    async def test_results(self):
+        self.server.update_button_icon(self.uuid(1), "<svg>1</svg>")
+        results = await self.set_icons(
+            {
+                self.uuid(0): "<svg>0</svg>",
+                self.uuid(1): "<svg>1</svg>",
+                self.uuid(2): "<svg>invalid</svg>",
+                self.uuid(3): "no svg",
+                "unknown": "<svg/>",
+            }
+        )
+
+        self.assertEqual(
+            results,
+            {
+                self.uuid(0): "changed",
+                self.uuid(1): "unchanged",
+                self.uuid(2): "Invalid svg: not an svg",
+                self.uuid(3): "Only svgs are supported",
+                "unknown": "Button not found",
+            },
+        )
+        self.assertEqual(self.server.registry.pending, 0)
+
+    async def test_invalid_body(self):
+        response = await self.client.post("/sd/icons", json=["<svg/>"])
+        self.assertEqual(response.status, 422)
+
+    async def test_failed_save(self):
+        await self.server.registry.flush_async()
+        self.fail_writes()
+
+        results = await self.set_icons({self.uuid(0): "<svg>0</svg>"})
+
+        self.assertEqual(results, {self.uuid(0): "changed"})
+        # Saved by the next flush
+        self.assertEqual(self.server.registry.pending, 1)
+
+    async def test_failed_save_over_websocket(self):
+        self.fail_writes()
+        web_socket = await self.connect()
+
+        await web_socket.send_json(
+            {"event": "setIcons", "id": 1, "args": {"icons": {self.uuid(0): "<svg/>"}}}
+        )
+
+        message = await self.receive(web_socket)
+        self.assertEqual(
+            message,
+            {
+                "event": "response",
+                "id": 1,
+                "args": {"ok": True, "results": {self.uuid(0): "changed"}},
+            },
+        )
+
+
+class CommandTest(ServerTestCase):
+    """Commands sent by websocket clients."""
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.web_socket = await self.connect()
+
+    async def command(self, event: str, args: any, request_id: int = 1) -> dict:
+        """Send a command and get the arguments of its response."""
+        await self.web_socket.send_json(
+            {"event": event, "id": request_id, "args": args}
+        )
+        while True:
+            message = await self.receive(self.web_socket)
+            if message["event"] == "response":
+                self.assertEqual(message["id"], request_id)
+                return message["args"]
+
+    async def test_commands_announced(self):
+        web_socket = await self.client.ws_connect("/")
+        connected = await self.receive(web_socket)
+        self.assertEqual(
+            connected["args"]["commands"], ["setIcon", "setIcons", "getIcon"]
+        )
+
+    async def test_set_and_get_icon(self):
+        uuid = self.uuid(0)
+        response = await self.command("setIcon", {"uuid": uuid, "svg": "<svg>1</svg>"})
+        self.assertEqual(response, {"ok": True, "changed": True})
+        response = await self.command("setIcon", {"uuid": uuid, "svg": "<svg>1</svg>"})
+        self.assertEqual(response, {"ok": True, "changed": False})
+
+        response = await self.command("getIcon", {"uuid": uuid})
+        self.assertEqual(response, {"ok": True, "svg": "<svg>1</svg>"})
+
+    async def test_set_icons(self):
+        response = await self.command(
+            "setIcons",
+            {"icons": {self.uuid(0): "<svg>0</svg>", self.uuid(1): "invalid"}},
+        )
+        self.assertEqual(
+            response,
+            {
+                "ok": True,
+                "results": {
+                    self.uuid(0): "changed",
+                    self.uuid(1): "Only svgs are supported",
+                },
+            },
+        )
+
+    async def test_errors(self):
+        svg = self.server.registry.get_by_uuid(self.uuid(0)).svg
+        for event, args, error in (
+            ("setIcon", {"uuid": "unknown", "svg": "<svg/>"}, "Button not found"),
+            ("setIcon", {"uuid": self.uuid(0)}, "Invalid arguments"),
+            (
+                "setIcon",
+                {"uuid": self.uuid(0), "svg": "<svg>invalid</svg>"},
+                "Invalid svg: not an svg",
+            ),
+            ("setIcons", {"icons": []}, "Invalid arguments"),
+            ("getIcon", {"uuid": "unknown"}, "Button not found"),
+        ):
+            with self.subTest(event=event, args=args):
+                response = await self.command(event, args)
+                self.assertEqual(response, {"ok": False, "error": error})
+        self.assertEqual(self.server.registry.get_by_uuid(self.uuid(0)).svg, svg)
+
+    async def test_unexpected_error(self):
+        async def fail(*_):
+            raise RuntimeError("Broken command")
+
+        self.server.set_icon = fail
+
+        response = await self.command(
+            "setIcon", {"uuid": self.uuid(0), "svg": "<svg/>"}
+        )
+        self.assertEqual(response, {"ok": False, "error": "Broken command"})
+
+
+if __name__ == "__main__":
+    unittest.main()
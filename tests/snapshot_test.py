@@ -0,0 +1,109 @@
+"""Tests for the Stream Deck API status snapshot."""
+
+import os
+import tempfile
+import unittest
+
+from streamdeckapi.registry import ButtonRegistry
+from streamdeckapi.snapshot import StatusSnapshot
+from streamdeckapi.tools import json_loads
+from streamdeckapi.types import SDApplication, SDButton
+
+APPLICATION = SDApplication(
+    {
+        "font": "Segoe UI",
+        "language": "en",
+        "platform": "Linux",
+        "platformVersion": "6",
+        "version": "0.0.1",
+    }
+)
+
+
+class StatusSnapshotTest(unittest.TestCase):
+    """Versions and deltas of the status."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.registry = ButtonRegistry(
+            os.path.join(self.directory.name, "streamdeckapi.db")
+        )
+        self.registry.load()
+        self.snapshot = StatusSnapshot(APPLICATION, [], self.registry)
+        self.registry.on_change = self.snapshot.touch
+        for key in range(3):
+            self.save(key, "<svg/>")
+
+    def tearDown(self):
+        self.registry.close()
+        self.directory.cleanup()
+
+    def save(self, key: int, svg: str):
+        """Save a button of deck AL123."""
+        self.registry.save(
+            ("AL123", key),
+            SDButton(
+                {
+                    "uuid": f"button-{key}",
+                    "device": "AL123",
+                    "position": {"x": key, "y": 0},
+                    "svg": svg,
+                }
+            ),
+        )
+
+    def delta(self, since: int, keys=None) -> dict:
+        """Get the changes after a version."""
+        message = json_loads(self.snapshot.delta_message(since, keys))
+        self.assertEqual(message["event"], "statusDelta")
+        return message["args"]
+
+    def test_delta_contains_changed_buttons(self):
+        since = self.snapshot.version
+        self.save(1, "<svg>1</svg>")
+
+        delta = self.delta(since)
+
+        self.assertEqual(delta["since"], since)
+        self.assertEqual(delta["version"], since + 1)
+        self.assertEqual(list(delta["buttons"]), ["AL123:1"])
+        self.assertEqual(delta["buttons"]["AL123:1"]["svg"], "<svg>1</svg>")
+        self.assertNotIn("devices", delta)
+
+    def test_delta_of_subscribed_buttons(self):
+        since = self.snapshot.version
+        self.save(0, "<svg>0</svg>")
+        self.save(1, "<svg>1</svg>")
+
+        delta = self.delta(since, {("AL123", 1)})
+
+        self.assertEqual(list(delta["buttons"]), ["AL123:1"])
+        # Filtered deltas don't replace the shared one
+        self.assertEqual(len(self.delta(since)["buttons"]), 2)
+
+    def test_delta_of_devices(self):
+        since = self.snapshot.version
+        self.snapshot.touch()
+
+        delta = self.delta(since)
+
+        self.assertEqual(delta["buttons"], {})
+        self.assertEqual(delta["devices"], [])
+
+    def test_current_version_is_empty_delta(self):
+        delta = self.delta(self.snapshot.version)
+        self.assertEqual(delta["buttons"], {})
+
+    def test_unknown_version(self):
+        self.assertIsNone(self.snapshot.delta_message(-1))
+        self.assertIsNone(self.snapshot.delta_message(self.snapshot.version + 1))
+
+    def test_heartbeat(self):
+        message = json_loads(self.snapshot.heartbeat_message())
+        self.assertEqual(
+            message, {"event": "heartbeat", "args": {"version": self.snapshot.version}}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
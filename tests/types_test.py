@@ -0,0 +1,127 @@
+"""Tests for the Stream Deck API types."""
+
+import unittest
+
+from streamdeckapi.types import SDInfo, SDWebsocketMessage
+
+DEVICE = {
+    "id": "AL123",
+    "name": "Stream Deck",
+    "type": 20,
+    "size": {"columns": 3, "rows": 2},
+}
+
+
+def create_button(uuid: str, x_pos: int, svg: str) -> dict:
+    """Create a raw button."""
+    return {
+        "uuid": uuid,
+        "device": "AL123",
+        "position": {"x": x_pos, "y": 0},
+        "svg": svg,
+    }
+
+
+def create_status(version: int = 1) -> dict:
+    """Create a raw status of two buttons."""
+    return {
+        "version": version,
+        "devices": [DEVICE],
+        "application": {
+            "font": "Segoe UI",
+            "language": "en",
+            "platform": "Linux",
+            "platformVersion": "6",
+            "version": "0.0.1",
+        },
+        "buttons": {
+            "AL123:0": create_button("first", 0, "<svg>0</svg>"),
+            "AL123:1": create_button("second", 1, "<svg>1</svg>"),
+        },
+    }
+
+
+class SDInfoTest(unittest.TestCase):
+    """Stream Deck info parsed from a status and its deltas."""
+
+    def test_apply_delta(self):
+        info = SDInfo(create_status())
+        self.assertEqual(info.buttons["AL123:1"].svg, "<svg>1</svg>")
+
+        info.apply_delta(
+            {
+                "version": 3,
+                "since": 1,
+                "buttons": {"AL123:1": create_button("second", 1, "<svg>new</svg>")},
+            }
+        )
+
+        self.assertEqual(info.version, 3)
+        self.assertEqual(info["version"], 3)
+        self.assertEqual(info.buttons["AL123:0"].svg, "<svg>0</svg>")
+        self.assertEqual(info.buttons["AL123:1"].svg, "<svg>new</svg>")
+        self.assertEqual(info["buttons"]["AL123:1"]["svg"], "<svg>new</svg>")
+
+    def test_apply_delta_before_buttons_are_read(self):
+        info = SDInfo(create_status())
+        info.apply_delta(
+            {
+                "version": 2,
+                "since": 1,
+                "buttons": {"AL123:2": create_button("third", 2, "<svg>2</svg>")},
+            }
+        )
+
+        self.assertEqual(
+            [button.uuid for button in info.buttons.values()],
+            ["first", "second", "third"],
+        )
+
+    def test_apply_delta_of_devices(self):
+        info = SDInfo(create_status())
+        device = dict(DEVICE, id="AL456")
+
+        info.apply_delta({"version": 2, "since": 1, "buttons": {}, "devices": [device]})
+
+        self.assertEqual([device.id for device in info.devices], ["AL456"])
+        self.assertEqual(info["devices"], [device])
+
+    def test_without_svg(self):
+        info = SDInfo(create_status(), with_svg=False)
+        info.apply_delta(
+            {
+                "version": 2,
+                "since": 1,
+                "buttons": {"AL123:1": create_button("second", 1, "<svg>new</svg>")},
+            }
+        )
+
+        self.assertEqual(
+            {_id: button.svg for _id, button in info.buttons.items()},
+            {"AL123:0": None, "AL123:1": None},
+        )
+        self.assertEqual(info.buttons["AL123:1"].position.x_pos, 1)
+
+    def test_to_dict(self):
+        status = create_status()
+        self.assertEqual(SDInfo(create_status()).to_dict(), status)
+
+
+class SDWebsocketMessageTest(unittest.TestCase):
+    """Websocket messages parsed from their raw JSON."""
+
+    def test_status_without_svg(self):
+        message = SDWebsocketMessage(
+            {"event": "status", "args": create_status()}, with_svg=False
+        )
+
+        self.assertIsInstance(message.args, SDInfo)
+        self.assertIsNone(message.args.buttons["AL123:0"].svg)
+
+    def test_event(self):
+        message = SDWebsocketMessage({"event": "keyDown", "args": "first"})
+        self.assertEqual((message.event, message.args), ("keyDown", "first"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+"""Tests for the Stream Deck API icon updater and deck writer."""
+
+import asyncio
+import time
+import unittest
+
+from streamdeckapi.fake import FakeStreamDeck
+from streamdeckapi.writer import DeckWriter, IconUpdater
+
+
+class EncodingRenderer:
+    """Renders an svg to its bytes, so the tests don't need cairo."""
+
+    def __init__(self) -> None:
+        self.renders = 0
+
+    async def render(self, _, svg: str) -> bytes:
+        self.renders += 1
+        await asyncio.sleep(0.005)
+        return svg.encode()
+
+
+class IconUpdaterTest(unittest.IsolatedAsyncioTestCase):
+    """Icon updates written to a fake deck."""
+
+    def setUp(self):
+        self.deck = FakeStreamDeck("mini", write_latency=0.005)
+        self.writer = DeckWriter(self.deck)
+        self.writer.start()
+        self.renderer = EncodingRenderer()
+        self.icons = IconUpdater(self.renderer, lambda _: self.writer)
+        self.key = (self.deck.get_serial_number(), 0)
+
+    def tearDown(self):
+        self.writer.stop()
+
+    async def wait_for_image(self, image: bytes, timeout: float = 2):
+        """Wait until the key shows an image."""
+        deadline = time.monotonic() + timeout
+        while self.deck.images.get(self.key[1]) != image:
+            if time.monotonic() > deadline:
+                self.fail(f"Key shows {self.deck.images.get(self.key[1])!r}")
+            await asyncio.sleep(0.001)
+
+    async def test_latest_icon_is_written(self):
+        for index in range(20):
+            self.icons.submit(self.deck, self.key, f"<svg>{index}</svg>")
+
+        await self.wait_for_image(b"<svg>19</svg>")
+
+        self.assertEqual(self.icons.submitted, 20)
+        self.assertGreater(self.icons.dropped, 0)
+        self.assertLess(self.renderer.renders, 20)
+        self.assertLess(self.deck.writes, 20)
+
+    async def test_min_frame_interval(self):
+        self.icons.set_min_frame_interval(self.key, 50)
+        started = time.monotonic()
+        self.icons.submit(self.deck, self.key, "<svg>first</svg>")
+        await self.wait_for_image(b"<svg>first</svg>")
+        self.icons.submit(self.deck, self.key, "<svg>second</svg>")
+        await self.wait_for_image(b"<svg>second</svg>")
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+        self.assertEqual(self.deck.writes, 2)
+
+    async def test_unchanged_image_is_skipped(self):
+        self.icons.submit(self.deck, self.key, "<svg/>")
+        await self.wait_for_image(b"<svg/>")
+        self.writer.submit(self.key[1], b"<svg/>")
+        self.writer.submit(1, b"other")
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(self.deck.writes, 2)
+        self.assertEqual(self.writer.skipped, 1)
+
+    async def test_clear_drops_icons_being_rendered(self):
+        self.icons.submit(self.deck, self.key, "<svg>stale</svg>")
+        await asyncio.sleep(0)
+        self.icons.clear()
+        self.writer.submit(self.key[1], b"alert")
+
+        await self.wait_for_image(b"alert")
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(self.deck.images[self.key[1]], b"alert")
+        self.assertEqual(self.deck.writes, 1)
+
+    async def test_clear_drops_queued_writes(self):
+        self.deck.write_latency = 0.05
+        for key in range(3):
+            self.writer.submit(key, b"stale")
+        self.writer.clear()
+        await asyncio.sleep(0.15)
+
+        # Only the write in progress finishes
+        self.assertLessEqual(self.deck.writes, 1)
+
+    def test_invalid_min_frame_interval(self):
+        for interval in (-1, 1.5, True):
+            with self.subTest(interval=interval):
+                with self.assertRaises(ValueError):
+                    self.icons.set_min_frame_interval(self.key, interval)
+
+    async def test_failed_write_keeps_writer_running(self):
+        # The fake deck raises IndexError for keys it doesn't have
+        self.writer.submit(self.deck.KEY_COUNT, b"missing")
+        self.writer.submit(self.key[1], b"shown")
+
+        await self.wait_for_image(b"shown")
+        self.assertEqual(self.deck.writes, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()